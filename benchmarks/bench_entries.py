@@ -0,0 +1,112 @@
+"""Memory and hashing cost of UserDataEntry on a 100k row log.
+
+Compares the slotted, row id hashed entry against the previous plain dataclass that
+hashed its full csv line. Run from the repository root:
+
+    python benchmarks/bench_entries.py [rows]
+"""
+
+import datetime
+import gc
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+import common
+
+ROWS: int = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+WORK_DIR = common.Workspace()
+
+from Defines import Status, UserDataEntry  # noqa: E402
+
+
+@dataclass
+class LegacyUserDataEntry:
+    """The entry as it was before, a plain dataclass hashed by its csv line."""
+
+    Artist: str
+    EntryStatus: Status
+    TimeAdded: datetime.datetime
+    TrackId: str
+    TrackName: str
+    URI: str
+    User: str
+    Bonus: str
+    PlaylistID: str
+
+    OutputString = UserDataEntry.OutputString
+
+    def __hash__(self) -> int:
+        """Hash the full csv line."""
+        return hash(self.OutputString)
+
+    @classmethod
+    def FromList(cls, dataFields: list[str]) -> "LegacyUserDataEntry":
+        """Create an instance from a list of dataFields, without interning."""
+        return cls(
+            PlaylistID=dataFields[0],
+            Artist=dataFields[6],
+            EntryStatus=Status(dataFields[3]),
+            TimeAdded=datetime.datetime.fromisoformat(dataFields[1]),
+            TrackId=dataFields[4],
+            TrackName=dataFields[5],
+            URI=dataFields[7],
+            User=dataFields[2],
+            Bonus=dataFields[8],
+        )
+
+
+def Measure(name: str, cls: type) -> dict[str, float]:
+    """Load a log of entries and time the hash heavy operations stats performs.
+
+    Memory is what the entries keep alive once the parsed csv rows are dropped.
+    """
+    gc.collect()
+    tracemalloc.start()
+    rows = common.GenerateRows(ROWS)
+    entries = [cls.FromList(row) for row in rows]
+    del rows
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    if cls is UserDataEntry:
+        # what UserDataStore.Append does
+        for i, entry in enumerate(entries):
+            entry.RowId = i
+
+    start = time.perf_counter()
+    keyed = {entry: i for i, entry in enumerate(entries)}
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for entry in entries:
+        _ = keyed[entry]
+    lookup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sorted(keyed.items(), key=lambda x: x[1], reverse=True)
+    trim = time.perf_counter() - start
+
+    result = {
+        "MiB": memory / 2**20,
+        "dict build s": build,
+        "dict lookup s": lookup,
+        "sort s": trim,
+    }
+    print(f"{name:>8}: " + ", ".join(f"{k} {v:.3f}" for k, v in result.items()))
+    return result
+
+
+def main() -> None:
+    """Run the comparison."""
+    print(f"{ROWS} rows")
+    legacy = Measure("legacy", LegacyUserDataEntry)
+    slotted = Measure("slotted", UserDataEntry)
+    for key in legacy:
+        print(f"{key:>14}: {legacy[key] / max(slotted[key], 1e-9):.1f}x")
+    common.Cleanup(WORK_DIR)
+
+
+if __name__ == "__main__":
+    main()
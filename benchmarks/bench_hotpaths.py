@@ -0,0 +1,239 @@
+"""Time the bot's hot paths offline, on generated logs against a fake Spotify client.
+
+Every log size runs in its own process so module level caches start cold. Results go
+to a json report, and two reports can be compared. Run from the repository root:
+
+    python benchmarks/bench_hotpaths.py [--rows 1000 10000 100000] [--latency 0.05]
+        [--out report.json]
+    python benchmarks/bench_hotpaths.py --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import common
+
+STATS_KEYWORDS: tuple[str, ...] = (
+    "release",
+    "duration",
+    "recent",
+    "popularity_tracks",
+    "popularity_artists",
+    "contrib",
+)
+FILTER_CONTENT: str = "!stats popularity_tracks user:user1 genre:rock released:1990..2010 T25"
+
+
+async def Run(rows: int, latency: float, repeat: int) -> dict:
+    """Generate a log of rows entries and time every hot path on it.
+
+    Returns
+    -------
+    dict
+        Summary per timed call, Spotify request counts and setup details
+    """
+    import Defines  # noqa: PLC0415
+    import Graphing  # noqa: PLC0415
+    from DataLogging import LogUserData  # noqa: PLC0415
+    from MetadataCache import GetCache  # noqa: PLC0415
+    from SpotifyAccess import AddToPlaylist  # noqa: PLC0415
+    from Stats import FilterData, GetPopularityTracks, UserStats  # noqa: PLC0415
+
+    generated = common.GenerateRows(rows)
+    common.WriteUserData(Defines.USER_DATA_FILE, generated)
+    common.WriteCache(Defines.CACHE_FILE, generated)
+    fake = common.FakeSpotify(latency)
+    Defines.SPOTIFY.Client = fake
+    renderer = common.RenderInProcess()
+
+    results: dict = {}
+
+    def Reload() -> None:
+        Defines.USER_DATA.Signature = None
+
+    results["GetUserDataStore cold"] = await common.TimeAsync(
+        Defines.GetUserDataStore,
+        repeat,
+        Reload,
+    )
+    # first access migrates cache.yml, a one off
+    await GetCache()
+
+    for keyword in STATS_KEYWORDS:
+        message = common.FakeMessage(f"!stats {keyword}")
+        # the first call fetches uncached metadata, the timed ones are the steady state
+        results[f"UserStats {keyword} first"] = await common.TimeAsync(
+            lambda m=message: UserStats(m),
+            1,
+        )
+        results[f"UserStats {keyword}"] = await common.TimeAsync(
+            lambda m=message: UserStats(m),
+            repeat,
+        )
+
+    filterMessage = common.FakeMessage(FILTER_CONTENT)
+    playlist = [x for x in (await Defines.GetUserData()) if x.PlaylistID == common.PLAYLISTS[0]]
+    tracks = await GetPopularityTracks(playlist)
+    results["FilterData"] = await common.TimeAsync(
+        lambda: FilterData(filterMessage, dict(tracks)),
+        repeat,
+    )
+
+    results["PrepDataFrame cold"] = await common.TimeAsync(
+        Graphing.PrepDataFrame,
+        repeat,
+        Graphing.FRAME_CACHE.clear,
+    )
+    results["PrepDataFrame"] = await common.TimeAsync(Graphing.PrepDataFrame, repeat)
+    frame = await Graphing.PrepDataFrame()
+    valid = frame.loc[frame["playlistID"] == common.PLAYLISTS[0]]
+    results["PrepUserData cold"] = await common.TimeAsync(
+        lambda: Graphing.PrepUserData(valid),
+        repeat,
+        Graphing.USER_FRAME_CACHE.clear,
+    )
+
+    def DropImages() -> None:
+        shutil.rmtree(Graphing.GRAPH_DIR, ignore_errors=True)
+
+    for graph in Graphing.FIGURES:
+        message = common.FakeMessage(f"!graph {graph}")
+        Graphing.RENDER_TIMINGS[graph].clear()
+        results[f"Graphs {graph}"] = await common.TimeAsync(
+            lambda m=message: Graphing.Graphs(m),
+            repeat,
+            DropImages,
+        )
+        if timings := Graphing.RENDER_TIMINGS[graph]:
+            middle = len(timings) // 2
+            results[f"Graphs {graph}"]["build median"] = sorted(x[0] for x in timings)[middle]
+            results[f"Graphs {graph}"]["render median"] = sorted(x[1] for x in timings)[middle]
+        else:
+            results[f"Graphs {graph}"]["failed"] = True
+
+    tracks, artists = common.Pools(rows)
+    logged = iter(generated)
+    fresh = iter(range(tracks, tracks + 2 * repeat))
+
+    def FreshTrack() -> str:
+        number = next(fresh)
+        return common.TrackId(number, number % artists)
+
+    results["AddToPlaylist repeat"] = await common.TimeAsync(
+        lambda: AddToPlaylist(next(logged)[4], common.PLAYLISTS[0], False),
+        repeat,
+    )
+    results["AddToPlaylist new track"] = await common.TimeAsync(
+        lambda: AddToPlaylist(FreshTrack(), common.PLAYLISTS[0], False),
+        repeat,
+    )
+    results["LogUserData"] = await common.TimeAsync(
+        lambda: LogUserData(
+            (FreshTrack(), "Track", "Artist", "spotify:track:x"),
+            "user0",
+            Defines.Status.Added,
+            common.PLAYLISTS[0],
+            False,
+        ),
+        repeat,
+    )
+
+    Graphing.RENDER_POOL.shutdown()
+    return {
+        "rows": rows,
+        "latency": latency,
+        "repeat": repeat,
+        "renderer": renderer,
+        "spotify calls": dict(fake.Calls),
+        "timings": results,
+    }
+
+
+def RunSize(rows: int, latency: float, repeat: int) -> dict:
+    """Benchmark one log size in a fresh interpreter, so every cache starts cold."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as fp:
+        out = Path(fp.name)
+    subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--child",
+            str(out),
+            "--rows",
+            str(rows),
+            "--latency",
+            str(latency),
+            "--repeat",
+            str(repeat),
+        ],
+        check=True,
+    )
+    try:
+        return json.loads(out.read_text(encoding="utf-8"))
+    finally:
+        out.unlink(missing_ok=True)
+
+
+def Compare(before: Path, after: Path) -> None:
+    """Print how median timings changed between two reports."""
+    old = json.loads(before.read_text(encoding="utf-8"))["results"]
+    new = json.loads(after.read_text(encoding="utf-8"))["results"]
+    for size in sorted(set(old) & set(new), key=int):
+        print(f"{size} rows")
+        oldTimings = old[size]["timings"]
+        newTimings = new[size]["timings"]
+        for name in oldTimings:
+            if name not in newTimings:
+                continue
+            a = oldTimings[name]["median"]
+            b = newTimings[name]["median"]
+            print(
+                f"  {name:<36} {a * 1000:10.2f}ms -> {b * 1000:10.2f}ms"
+                f"  {a / max(b, 1e-9):6.2f}x",
+            )
+
+
+def main() -> None:
+    """Run the benchmark for every requested size, or compare two reports."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=list(common.SIZES))
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds per fake Spotify request",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per hot path")
+    parser.add_argument("--out", type=Path, default=Path("bench_report.json"))
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        Compare(*args.compare)
+        return
+    if args.child:
+        workDir = common.Workspace({"CacheBackend": "sqlite"})
+        try:
+            result = asyncio.run(Run(args.rows[0], args.latency, args.repeat))
+        finally:
+            common.Cleanup(workDir)
+        args.child.write_text(json.dumps(result), encoding="utf-8")
+        return
+
+    out = args.out.resolve()
+    results = {}
+    for rows in args.rows:
+        print(f"Benchmarking {rows} rows")
+        results[str(rows)] = RunSize(rows, args.latency, args.repeat)
+    common.WriteReport(out, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Replay simulated discord traffic against MessageHandler at a target rate.
+
+Messages arrive open loop on a fixed schedule, whether or not earlier ones finished,
+so queueing shows up in latency. Latency is measured from a message's scheduled
+arrival to its handler returning. Event loop lag is how late a periodic timer fires.
+Throughput counts only messages handled without error, over the traffic duration or
+the time until the last one finished if that is longer, so it matches the offered
+rate while the bot keeps up and falls behind it once it cannot.
+
+With --ramp the replay is repeated at each rate in turn, stopping at the first rate
+where a message fails or the p99 latency or p99 loop lag passes its limit, and the
+highest rate within the limits is reported as the sustained rate. Run from the
+repository root:
+
+    python benchmarks/bench_load.py [--rows 10000] [--rate 20] [--duration 30]
+        [--ramp 5 10 20 40 80] [--p99-limit 2000] [--lag-limit 100] [--out load.json]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import common
+
+LAG_INTERVAL: float = 0.01
+STATS_COMMANDS: tuple[str, ...] = (
+    "!stats popularity_tracks",
+    "!stats contrib",
+    "!stats recent user:user3",
+    "!stats release T20",
+    "!stats popularity_artists last:30d",
+)
+GRAPH_COMMANDS: tuple[str, ...] = (
+    "!graph users",
+    "!graph heat",
+    "!graph genres",
+    "!graph duration",
+)
+CHAT: tuple[str, ...] = ("anyone got recommendations", "i'm hungry", "that last one slaps")
+
+
+def Percentiles(samples: list[float]) -> dict[str, float | int]:
+    """p50, p95, p99 and max of samples in seconds, as milliseconds."""
+    if not samples:
+        return {"n": 0}
+    # quantiles needs two points
+    cuts = statistics.quantiles(
+        samples * 2 if len(samples) == 1 else samples,
+        n=100,
+        method="inclusive",
+    )
+    return {
+        "n": len(samples),
+        "p50 ms": cuts[49] * 1000,
+        "p95 ms": cuts[94] * 1000,
+        "p99 ms": cuts[98] * 1000,
+        "max ms": max(samples) * 1000,
+    }
+
+
+def BuildSchedule(
+    channels: list[str],
+    logged: list[str],
+    nextTrack: int,
+    artists: int,
+    rate: float,
+    args: argparse.Namespace,
+) -> list[tuple[float, str, common.FakeMessage]]:
+    """Seeded traffic: arrival offset, kind and message for every simulated message.
+
+    Track posts are repeats of logged tracks or new ones, starting from track number
+    nextTrack, commands are !stats and !graph variants, the rest is chat that only
+    reaches DadMode.
+    """
+    rng = random.Random(f"{args.seed}-{rate}")
+    schedule = []
+    offset = 0.0
+    for _ in range(int(rate * args.duration)):
+        # poisson arrivals at the target rate
+        offset += rng.expovariate(rate)
+        roll = rng.random()
+        if roll < args.stats_share:
+            kind, content = "stats", rng.choice(STATS_COMMANDS)
+        elif roll < args.stats_share + args.graph_share:
+            kind, content = "graph", rng.choice(GRAPH_COMMANDS) + rng.choice(["", " followers"])
+        elif roll < args.stats_share + args.graph_share + args.chat_share:
+            kind, content = "chat", rng.choice(CHAT)
+        elif rng.random() < args.repeat_share:
+            kind, content = "repeat track", common.TRACK_LINK.format(rng.choice(logged))
+        else:
+            kind = "new track"
+            content = common.TRACK_LINK.format(common.TrackId(nextTrack, nextTrack % artists))
+            nextTrack += 1
+        message = common.FakeMessage(
+            content,
+            author=f"user{rng.randrange(12)}",
+            channel=common.FakeChannel(rng.choice(channels)),
+        )
+        schedule.append((offset, kind, message))
+    return schedule
+
+
+async def MonitorLag(samples: list[float], stop: asyncio.Event) -> None:
+    """Record how late a LAG_INTERVAL timer wakes up until stopped."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + LAG_INTERVAL
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(loop.time() - expected, 0.0))
+
+
+async def Replay(
+    handler: Callable[[common.FakeMessage], Awaitable[None]],
+    schedule: list[tuple[float, str, common.FakeMessage]],
+    rate: float,
+    duration: float,
+) -> dict:
+    """Deliver one schedule spanning duration seconds to the handler and summarise it.
+
+    Returns
+    -------
+    dict
+        latency percentiles overall and per message kind, loop lag and throughput
+    """
+    latencies: defaultdict[str, list[float]] = defaultdict(list)
+    errors: defaultdict[str, int] = defaultdict(int)
+    lag: list[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(MonitorLag(lag, stop))
+    loop = asyncio.get_running_loop()
+
+    async def Deliver(arrival: float, kind: str, message: common.FakeMessage) -> None:
+        await asyncio.sleep(max(arrival - loop.time(), 0.0))
+        try:
+            await handler(message)
+        except Exception as e:  # noqa: BLE001
+            print(f"{kind} failed: {e!r}")
+            errors[kind] += 1
+            return
+        latencies[kind].append(loop.time() - arrival)
+
+    print(f"Replaying {len(schedule)} messages at {rate:g}/s")
+    start = loop.time()
+    wall = time.perf_counter()
+    await asyncio.gather(
+        *(Deliver(start + offset, kind, message) for offset, kind, message in schedule),
+    )
+    elapsed = time.perf_counter() - wall
+    stop.set()
+    await monitor
+
+    handled = sum(len(x) for x in latencies.values())
+    return {
+        "target rate": rate,
+        "sent": len(schedule),
+        "handled": handled,
+        "offered per s": len(schedule) / duration,
+        # arrivals end before duration by chance, messages still queued run past it
+        "completed per s": handled / max(elapsed, duration),
+        "elapsed s": elapsed,
+        "errors": dict(errors),
+        "end to end": Percentiles([x for samples in latencies.values() for x in samples]),
+        "by kind": {kind: Percentiles(samples) for kind, samples in sorted(latencies.items())},
+        "loop lag": Percentiles(lag),
+    }
+
+
+def WithinLimits(step: dict, args: argparse.Namespace) -> bool:
+    """Whether every message of a replay was handled with p99 latency and lag in bounds."""
+    return (
+        not step["errors"]
+        and step["end to end"].get("p99 ms", float("inf")) <= args.p99_limit
+        and step["loop lag"].get("p99 ms", float("inf")) <= args.lag_limit
+    )
+
+
+async def Run(args: argparse.Namespace) -> dict:
+    """Generate a log, replay the traffic at every rate and summarise each replay.
+
+    Returns
+    -------
+    dict
+        setup, one summary per rate and the highest rate within the limits
+    """
+    import Defines  # noqa: PLC0415
+    from MetadataCache import GetCache  # noqa: PLC0415
+    from Spoticord import MessageHandler  # noqa: PLC0415
+
+    generated = common.GenerateRows(args.rows)
+    common.WriteUserData(Defines.USER_DATA_FILE, generated)
+    common.WriteCache(Defines.CACHE_FILE, generated)
+    fake = common.FakeSpotify(args.latency)
+    Defines.SPOTIFY.Client = fake
+    renderer = common.RenderInProcess()
+    await Defines.GetUserDataStore()
+    await GetCache()
+
+    nextTrack, artists = common.Pools(args.rows)
+    logged = sorted({row[4] for row in generated})
+    steps = []
+    sustained = None
+    for rate in args.ramp or [args.rate]:
+        schedule = BuildSchedule(
+            list(Defines.CONFIG["Channel Maps"]),
+            logged,
+            nextTrack,
+            artists,
+            rate,
+            args,
+        )
+        # later replays post tracks the earlier ones have not
+        nextTrack += sum(kind == "new track" for _, kind, _ in schedule)
+        step = await Replay(MessageHandler, schedule, rate, args.duration)
+        step["within limits"] = WithinLimits(step, args)
+        steps.append(step)
+        if not step["within limits"]:
+            break
+        sustained = rate
+    if Defines.PERSISTENCE.Task is not None:
+        Defines.PERSISTENCE.Task.cancel()
+
+    return {
+        "rows": args.rows,
+        "duration s": args.duration,
+        "latency": args.latency,
+        "renderer": renderer,
+        "p99 limit ms": args.p99_limit,
+        "lag limit ms": args.lag_limit,
+        "sustained rate": sustained,
+        "spotify calls": dict(fake.Calls),
+        "steps": steps,
+    }
+
+
+def main() -> None:
+    """Parse options, run the replay and write the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000, help="size of the generated log")
+    parser.add_argument("--rate", type=float, default=20.0, help="messages per second")
+    parser.add_argument(
+        "--ramp",
+        type=float,
+        nargs="+",
+        help="messages per second of each replay in turn, instead of --rate",
+    )
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic per rate")
+    parser.add_argument(
+        "--p99-limit",
+        type=float,
+        default=2000.0,
+        help="highest p99 end to end latency in ms a rate may have to be sustained",
+    )
+    parser.add_argument(
+        "--lag-limit",
+        type=float,
+        default=100.0,
+        help="highest p99 event loop lag in ms a rate may have to be sustained",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds per fake Spotify request",
+    )
+    parser.add_argument("--stats-share", type=float, default=0.05)
+    parser.add_argument("--graph-share", type=float, default=0.01)
+    parser.add_argument("--chat-share", type=float, default=0.2)
+    parser.add_argument(
+        "--repeat-share",
+        type=float,
+        default=0.3,
+        help="share of track posts that are repeats",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=Path("load_report.json"))
+    args = parser.parse_args()
+    out = args.out.resolve()
+
+    workDir = common.Workspace({"CacheBackend": "sqlite"})
+    try:
+        result = asyncio.run(Run(args))
+    finally:
+        common.Cleanup(workDir)
+    for step in result["steps"]:
+        print(
+            f"{step['offered per s']:.1f}/s offered, {step['completed per s']:.1f}/s handled"
+            f" ({'within' if step['within limits'] else 'over'} limits)",
+        )
+        summaries = [(x, step[x]) for x in ("end to end", "loop lag")]
+        for name, summary in summaries + list(step["by kind"].items()):
+            values = (
+                f"{k} {v:.1f}" if isinstance(v, float) else f"{k} {v}" for k, v in summary.items()
+            )
+            print(f"{name:>14}: " + ", ".join(values))
+    if result["sustained rate"] is None:
+        print("No rate stayed within the limits")
+    else:
+        print(f"Sustained {result['sustained rate']:g} messages/s")
+    common.WriteReport(out, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Record spotify responses to a fixture store, then benchmark SpotifyAccess against replays.
+
+record drives the real client with the bot's config and credentials, run it from the
+directory holding data/, or with --fake to record FakeSpotify for a fixture store
+that needs no account. The live bot records everything it sends when SpotifyRecordDir
+is set in its config. bench replays a store with injected latency and throttling:
+
+    python benchmarks/bench_spotify.py record --out fixtures [--tracks 500] [--scratch-playlist ID]
+    python benchmarks/bench_spotify.py record --fake --out fixtures
+    python benchmarks/bench_spotify.py bench --fixtures fixtures [--latency 0.05] [--throttle 20]
+        [--out spotify.json]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import spotipy
+
+import common
+
+
+async def Record(args: argparse.Namespace) -> None:
+    """Fetch the logged tracks, their artists and the mapped playlists through a recorder."""
+    if args.fake:
+        common.WriteUserData(Path("data/user_data.csv"), common.GenerateRows(args.tracks * 4))
+    import Defines  # noqa: PLC0415
+    import MetadataCache  # noqa: PLC0415
+    from SpotifyAccess import GetAllTracks, GetFullInfo, GetFullInfoBatch  # noqa: PLC0415
+    from SpotifyFixtures import FixtureStore, RecordingSpotify  # noqa: PLC0415
+
+    client = common.FakeSpotify(args.fake_latency) if args.fake else Defines.SPOTIFY_CLIENT
+    store = FixtureStore(args.out)
+    Defines.SPOTIFY.Client = RecordingSpotify(client, store)
+    # an empty cache, so every object is requested
+    Defines.CONFIG["CacheBackend"] = "memory"
+    MetadataCache.CACHE_FILE = Path("missing")
+
+    trackIds = list(dict.fromkeys(x.TrackId for x in await Defines.GetUserData()))[: args.tracks]
+    print(f"Recording {len(trackIds)} tracks")
+    # a few one by one, as new submissions are fetched
+    for trackId in trackIds[:5]:
+        await GetFullInfo(trackId)
+    await GetFullInfoBatch(trackIds)
+    for playlistId in set(Defines.CONFIG["Channel Maps"].values()):
+        await GetAllTracks(playlistId)
+    if args.scratch_playlist:
+        await Defines.SPOTIFY.playlist_add_items(args.scratch_playlist, trackIds[:1])
+        await Defines.SPOTIFY.playlist_replace_items(args.scratch_playlist, [])
+    print(f"Recorded {len(store.Calls)} calls to {args.out}")
+
+
+async def Bench(args: argparse.Namespace) -> dict:
+    """Time SpotifyAccess against a replayed fixture store.
+
+    Returns
+    -------
+    dict
+        Summary per timed call and what the replay served
+    """
+    import Defines  # noqa: PLC0415
+    import MetadataCache  # noqa: PLC0415
+    from SpotifyAccess import (  # noqa: PLC0415
+        AddToPlaylist,
+        GetAllTracks,
+        GetFullInfo,
+        GetFullInfoBatch,
+    )
+    from SpotifyFixtures import FixtureStore, ReplaySpotify  # noqa: PLC0415
+
+    store = FixtureStore(args.fixtures)
+    trackIds = sorted(store.Objects["track"])
+    if not trackIds:
+        raise SystemExit(f"No recorded tracks in {args.fixtures}")
+    # a log made of the recorded tracks, so repeats and stats see real payloads
+    rows = common.GenerateRows(args.rows)
+    for row in rows:
+        row[4] = trackIds[int(row[4]) % len(trackIds)]
+    common.WriteUserData(Defines.USER_DATA_FILE, rows)
+    replay = ReplaySpotify(store, args.latency, args.throttle)
+    Defines.SPOTIFY.Client = replay
+
+    def ColdCache() -> None:
+        MetadataCache.METADATA_CACHE = None
+
+    results: dict = {}
+    errors: dict[str, int] = {}
+
+    async def Timed(
+        name: str,
+        func: Callable[[], Awaitable],
+        before: Callable | None = None,
+    ) -> None:
+        """Time func, counting the errors that escape SpotifyAccess."""
+
+        async def Call() -> None:
+            try:
+                await func()
+            except spotipy.exceptions.SpotifyException as e:
+                errors[f"{name} {e.http_status}"] = errors.get(f"{name} {e.http_status}", 0) + 1
+            except Exception as e:  # noqa: BLE001
+                # e.g. a throttled metadata fetch leaving a track without info
+                errors[f"{name} {e!r}"] = errors.get(f"{name} {e!r}", 0) + 1
+
+        results[name] = await common.TimeAsync(Call, args.repeat, before)
+
+    await Timed("GetFullInfoBatch cold", lambda: GetFullInfoBatch(trackIds), ColdCache)
+    await Timed("GetFullInfo cold", lambda: GetFullInfo(trackIds[0]), ColdCache)
+    calls = {x["method"]: json.loads(x["key"])[1] for x in store.Calls.values()}
+    if "playlist_tracks" in calls:
+        await Timed("GetAllTracks", lambda: GetAllTracks(calls["playlist_tracks"][0]))
+    # the recorded add if there is one, otherwise adds fail as unrecorded
+    playlistId, added = calls.get("playlist_add_items", ["scratch", trackIds[-1:]])
+    statuses: dict[str, int] = {}
+
+    async def Add() -> None:
+        status, _ = await AddToPlaylist(added[0], playlistId, False)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    await Timed("AddToPlaylist", Add, ColdCache)
+
+    # a burst of single fetches, as a busy channel would make
+    async def Burst() -> None:
+        for result in await asyncio.gather(
+            *(GetFullInfo(x) for x in trackIds[: args.burst]),
+            return_exceptions=True,
+        ):
+            if isinstance(result, spotipy.exceptions.SpotifyException):
+                key = f"burst {result.http_status}"
+                errors[key] = errors.get(key, 0) + 1
+
+    await Timed("GetFullInfo burst", Burst, ColdCache)
+    return {
+        "fixtures": str(args.fixtures),
+        "recorded calls": len(store.Calls),
+        "latency": args.latency,
+        "throttle": args.throttle,
+        "spotify calls": dict(replay.Calls),
+        "throttled": replay.Throttled,
+        "missed": replay.Missed,
+        "add statuses": statuses,
+        "errors": errors,
+        "timings": results,
+    }
+
+
+def main() -> None:
+    """Record or benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record a fixture store")
+    record.add_argument("--out", type=Path, required=True)
+    record.add_argument(
+        "--conf",
+        type=Path,
+        default=Path("data/conf.yml"),
+        help="bot config with credentials",
+    )
+    record.add_argument("--tracks", type=int, default=500, help="logged tracks to fetch")
+    record.add_argument("--scratch-playlist", help="playlist to record an add and a clear on")
+    record.add_argument("--fake", action="store_true", help="record FakeSpotify on a generated log")
+    record.add_argument("--fake-latency", type=float, default=0.0)
+    bench = commands.add_parser("bench", help="benchmark against a fixture store")
+    bench.add_argument("--fixtures", type=Path, required=True)
+    bench.add_argument("--rows", type=int, default=10_000, help="size of the generated log")
+    bench.add_argument("--latency", type=float, help="seconds per request, by default as recorded")
+    bench.add_argument("--throttle", type=float, help="requests per second before 429s")
+    bench.add_argument("--burst", type=int, default=50, help="concurrent fetches in the burst")
+    bench.add_argument("--repeat", type=int, default=5)
+    bench.add_argument("--out", type=Path, default=Path("spotify_report.json"))
+    args = parser.parse_args()
+    args.out = args.out.resolve()
+
+    if args.command == "record":
+        start = time.perf_counter()
+        if args.fake:
+            workDir = common.Workspace()
+        else:
+            # Defines reads its config path from argv
+            sys.argv = [sys.argv[0], str(args.conf)]
+            sys.path.insert(0, str(common.ROOT / "src"))
+        try:
+            asyncio.run(Record(args))
+        finally:
+            if args.fake:
+                common.Cleanup(workDir)
+        print(f"Took {time.perf_counter() - start:.1f}s")
+        return
+    args.fixtures = args.fixtures.resolve()
+    workDir = common.Workspace({"CacheBackend": "memory"})
+    try:
+        result = asyncio.run(Bench(args))
+    finally:
+        common.Cleanup(workDir)
+    for name, summary in result["timings"].items():
+        print(f"{name:>22}: median {summary['median'] * 1000:.1f}ms")
+    print(
+        f"throttled {result['throttled']}, missed {result['missed']},"
+        f" adds {result['add statuses']}",
+    )
+    print(f"errors {result['errors']}")
+    common.WriteReport(args.out, result)
+
+
+if __name__ == "__main__":
+    main()
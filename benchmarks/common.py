@@ -0,0 +1,449 @@
+"""Shared setup for the offline benchmarks: a scratch working dir, synthetic data and fakes.
+
+Defines reads its config on import, so call Workspace before importing any bot module.
+"""
+
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+SIZES: tuple[int, ...] = (1_000, 10_000, 100_000)
+PLAYLISTS: tuple[str, ...] = ("playlist0", "playlist1", "playlist2")
+CHANNEL: str = "bench"
+TRACK_LINK: str = "https://open.spotify.com/track/{}"
+GENRE_POOL: tuple[str, ...] = (
+    "rock",
+    "indie rock",
+    "pop",
+    "dance pop",
+    "hip-hop",
+    "uk garage",
+    "metal",
+    "ska",
+    "big band",
+    "jazz",
+)
+
+
+def Workspace(config: dict | None = None) -> Path:
+    """Move into a fresh scratch dir holding a bot config, so nothing touches the real data.
+
+    Parameters
+    ----------
+    config : dict | None, optional
+        keys to set on top of data/sample_conf.yml
+
+    Returns
+    -------
+    Path
+        the scratch dir, now the working dir
+    """
+    workDir = Path(tempfile.mkdtemp(prefix="spoticord_bench_"))
+    (workDir / "data").mkdir()
+    conf = yaml.safe_load((ROOT / "data" / "sample_conf.yml").read_text(encoding="utf-8"))
+    conf.update(
+        {
+            "Channel Maps": {
+                CHANNEL if i == 0 else f"{CHANNEL}{i}": x for i, x in enumerate(PLAYLISTS)
+            },
+            "Regex": {
+                "track": r"open\.spotify\.com/track/([0-9a-zA-Z]{22})",
+                "artist": r"open\.spotify\.com/artist/([0-9a-zA-Z]{22})",
+            },
+            "DadCommands": [{"regex": r"\bi'?m (\w+)", "response": "Hi {subject}, I'm dad"}],
+            "UpdateInterval": 100,
+            "UserColors": {},
+            "Vibes": {},
+            "SaveDelay": 3600.0,
+        },
+    )
+    conf.update(config or {})
+    (workDir / "data" / "conf.yml").write_text(yaml.safe_dump(conf), encoding="utf-8")
+    (workDir / "data" / "memory.yml").write_text(
+        yaml.safe_dump({"LastChannel": "0", "UserPlaylists": {}}),
+        encoding="utf-8",
+    )
+    os.chdir(workDir)
+    # Defines reads its config path from argv
+    sys.argv = sys.argv[:1]
+    if str(ROOT / "src") not in sys.path:
+        sys.path.insert(0, str(ROOT / "src"))
+    return workDir
+
+
+def TrackId(number: int, artist: int) -> str:
+    """Spotify shaped track id with its artist encoded, so fakes can answer for any id."""
+    return f"{artist:08d}{number:014d}"
+
+
+def ArtistId(artist: int) -> str:
+    """Spotify shaped artist id."""
+    return f"A{artist:021d}"
+
+
+def ArtistOfTrack(trackId: str) -> int:
+    """Artist number encoded in a TrackId."""
+    return int(trackId[:8])
+
+
+def Pools(count: int) -> tuple[int, int]:
+    """Number of distinct tracks and artists in a log of count rows."""
+    return max(count // 4, 1), max(count // 20, 1)
+
+
+def GenerateRows(count: int, seed: int = 0) -> list[list[str]]:
+    """Random log rows as they come out of the csv reader, every string a fresh object.
+
+    Parameters
+    ----------
+    count : int
+        number of rows
+    seed : int, optional
+        random seed, by default 0
+
+    Returns
+    -------
+    list[list[str]]
+        rows in data file column order, in time order
+    """
+    rng = random.Random(seed)
+    tracks, artists = Pools(count)
+    start = datetime.datetime(2023, 1, 1)
+    statuses = ["Added", "Added", "Added", "Repeat", "Failed"]
+    rows = []
+    for i in range(count):
+        number = rng.randrange(tracks)
+        track = TrackId(number, number % artists)
+        rows.append(
+            [
+                PLAYLISTS[rng.randrange(len(PLAYLISTS))],
+                str(start + datetime.timedelta(minutes=7 * i)),
+                f"user{rng.randrange(12)}",
+                rng.choice(statuses),
+                track,
+                f"Track {track}",
+                f"Artist {number % artists}",
+                f"spotify:track:{track}",
+                "",
+            ],
+        )
+    return rows
+
+
+def WriteUserData(path: Path, rows: list[list[str]]) -> None:
+    """Write rows as a user data log, in the format AppendUserData produces."""
+    from Defines import UserDataEntry  # noqa: PLC0415
+
+    header = "playlistID,time,user,result,track,name,artist,uri,bonus"
+    lines = [UserDataEntry.FromList(row).OutputString for row in rows]
+    path.write_text("\n".join([header, *lines]), encoding="utf-8")
+
+
+def TrackPayload(trackId: str) -> dict:
+    """Full spotify track object for a generated track id."""
+    rng = random.Random(trackId)
+    artist = ArtistOfTrack(trackId)
+    released = rng.choice(
+        [
+            f"{rng.randrange(1960, 2025)}",
+            f"{rng.randrange(1960, 2025)}-{rng.randrange(1, 13):02d}",
+            f"{rng.randrange(1960, 2025)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        ],
+    )
+    return {
+        "id": trackId,
+        "name": f"Track {trackId}",
+        "popularity": rng.randrange(101),
+        "duration_ms": rng.randrange(90_000, 420_000),
+        "uri": f"spotify:track:{trackId}",
+        "available_markets": ["GB"],
+        "album": {"id": f"album{trackId[-10:-2]}", "name": "Album", "release_date": released},
+        "artists": [{"id": ArtistId(artist), "name": f"Artist {artist}"}],
+    }
+
+
+def ArtistPayload(artistId: str) -> dict:
+    """Full spotify artist object for a generated artist id."""
+    rng = random.Random(artistId)
+    return {
+        "id": artistId,
+        "name": f"Artist {int(artistId[1:])}",
+        "popularity": rng.randrange(101),
+        "genres": rng.sample(GENRE_POOL, rng.randrange(4)),
+        "followers": {"total": rng.randrange(10, 10_000_000)},
+    }
+
+
+def WriteCache(path: Path, rows: list[list[str]], coverage: float = 0.9) -> None:
+    """Write a legacy cache.yml holding metadata for a share of the logged tracks.
+
+    Parameters
+    ----------
+    path : Path
+        cache.yml to write
+    rows : list[list[str]]
+        generated log rows
+    coverage : float, optional
+        share of distinct tracks that are cached, the rest are fetched, by default 0.9
+    """
+    trackIds = sorted({row[4] for row in rows})
+    cached = trackIds[: int(len(trackIds) * coverage)]
+    data = {
+        "tracks": {x: TrackPayload(x) for x in cached},
+        "artists": {
+            ArtistId(a): ArtistPayload(ArtistId(a)) for a in {ArtistOfTrack(x) for x in cached}
+        },
+    }
+    with path.open(mode="w", encoding="utf-8") as fp:
+        yaml.dump(data, fp, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper))
+
+
+def RenderInProcess() -> str:
+    """Render graphs in a worker thread of this process instead of the render pool.
+
+    Keeps timings and patches in one process. Without kaleido, figures are written as
+    json instead of images so their building is still exercised.
+
+    Returns
+    -------
+    str
+        which renderer is in use
+    """
+    import Graphing  # noqa: PLC0415
+    import GraphRender  # noqa: PLC0415
+
+    Graphing.RENDER_POOL = ThreadPoolExecutor(max_workers=1)
+    try:
+        import kaleido  # noqa: F401, PLC0415
+    except ImportError:
+
+        def WriteJson(fig: Any, dst: Path, **_kwargs: Any) -> None:
+            Path(dst).write_text(fig.to_json())
+
+        GraphRender.pio.write_image = WriteJson
+        return "json (kaleido not installed)"
+    return "kaleido"
+
+
+class FakeSpotify:
+    """In-process stand in for the spotipy client methods the bot uses.
+
+    Every call sleeps for the configured latency, in the calling worker thread as a
+    blocking request would, and is counted per method.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """Create a fake client.
+
+        Parameters
+        ----------
+        latency : float, optional
+            seconds every request takes, by default 0.0
+        """
+        self.Latency = latency
+        self.Calls: Counter[str] = Counter()
+        self.Lock = threading.Lock()
+        self.Playlists: dict[str, list[str]] = {x: [] for x in PLAYLISTS}
+
+    def Request(self, method: str) -> None:
+        """Count a request and wait out its latency."""
+        with self.Lock:
+            self.Calls[method] += 1
+        if self.Latency:
+            time.sleep(self.Latency)
+
+    def track(self, trackId: str) -> dict:
+        """Get one track."""
+        self.Request("track")
+        return TrackPayload(trackId)
+
+    def tracks(self, trackIds: list[str]) -> dict:
+        """Get up to 50 tracks."""
+        self.Request("tracks")
+        return {"tracks": [TrackPayload(x) for x in trackIds]}
+
+    def artist(self, artistId: str) -> dict:
+        """Get one artist."""
+        self.Request("artist")
+        return ArtistPayload(artistId)
+
+    def artists(self, artistIds: list[str]) -> dict:
+        """Get up to 50 artists."""
+        self.Request("artists")
+        return {"artists": [ArtistPayload(x) for x in artistIds]}
+
+    def playlist_add_items(self, playlistId: str, items: list[str]) -> dict:
+        """Append tracks to a playlist."""
+        self.Request("playlist_add_items")
+        self.Playlists.setdefault(playlistId, []).extend(items)
+        return {"snapshot_id": str(len(self.Playlists[playlistId]))}
+
+    def playlist_replace_items(self, playlistId: str, items: list[str]) -> dict:
+        """Replace a playlist's tracks."""
+        self.Request("playlist_replace_items")
+        self.Playlists[playlistId] = list(items)
+        return {"snapshot_id": str(len(items))}
+
+    def playlist_change_details(self, playlistId: str, **_kwargs: Any) -> None:
+        """Change a playlist's description."""
+        self.Request("playlist_change_details")
+
+    def user_playlist_create(self, user: str, name: str, **_kwargs: Any) -> dict:
+        """Create a playlist."""
+        self.Request("user_playlist_create")
+        playlistId = f"created{len(self.Playlists)}"
+        self.Playlists[playlistId] = []
+        return {"id": playlistId, "name": name, "owner": user}
+
+    def playlist_tracks(self, playlistId: str) -> dict:
+        """Get a playlist's tracks in a single page."""
+        self.Request("playlist_tracks")
+        return {
+            "items": [{"track": TrackPayload(x)} for x in self.Playlists.get(playlistId, [])],
+            "next": None,
+        }
+
+    def next(self, _result: dict) -> dict:
+        """Get the next page, there never is one."""
+        self.Request("next")
+        return {"items": [], "next": None}
+
+
+class FakeChannel:
+    """Discord channel stand in that keeps what is sent to it."""
+
+    def __init__(self, name: str = CHANNEL, channelId: int = 0) -> None:
+        """Create a channel."""
+        self.name = name
+        self.id = channelId
+        self.Sent: list[str] = []
+
+    async def send(self, content: str = "", **_kwargs: Any) -> "FakeMessage":
+        """Post a message."""
+        self.Sent.append(content)
+        return FakeMessage(content, channel=self)
+
+
+class FakeAuthor:
+    """Discord user stand in, printing as its name like a discord.User."""
+
+    def __init__(self, name: str, userId: int = 0) -> None:
+        """Create a user."""
+        self.name = name
+        self.id = userId
+
+    def __str__(self) -> str:
+        """Username."""
+        return self.name
+
+
+class FakeMessage:
+    """Discord message stand in with just what the bot reads and calls."""
+
+    def __init__(
+        self,
+        content: str,
+        author: str = "user0",
+        channel: FakeChannel | None = None,
+    ) -> None:
+        """Create a message."""
+        self.content = content
+        self.author = FakeAuthor(author)
+        self.channel = channel or FakeChannel()
+        self.Replies: list[str] = []
+
+    async def reply(self, content: str = "", **_kwargs: Any) -> "FakeMessage":
+        """Reply to the message."""
+        self.Replies.append(content)
+        return FakeMessage(content, channel=self.channel)
+
+
+def Summary(samples: list[float]) -> dict[str, float | int]:
+    """Summary statistics of timing samples in seconds."""
+    return {
+        "n": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+async def TimeAsync(
+    func: Callable[[], Awaitable[Any]],
+    repeat: int,
+    before: Callable[[], Any] | None = None,
+) -> dict[str, float | int]:
+    """Time repeated awaits of func.
+
+    Parameters
+    ----------
+    func : Callable[[], Awaitable[Any]]
+        call to time
+    repeat : int
+        number of timed calls
+    before : Callable[[], Any] | None, optional
+        untimed setup run before every call, e.g. to drop a cache
+
+    Returns
+    -------
+    dict[str, float | int]
+        Summary of the call durations
+    """
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return Summary(samples)
+
+
+def RunInfo() -> dict[str, str]:
+    """Where and on what code a benchmark ran, to tell reports apart."""
+    try:
+        commit = subprocess.run(
+            ["git", "-C", str(ROOT), "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "time": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def WriteReport(path: Path, results: dict) -> None:
+    """Write benchmark results as a json report along with RunInfo."""
+    path.write_text(json.dumps({"run": RunInfo(), "results": results}, indent=2), encoding="utf-8")
+    print(f"Wrote {path}")
+
+
+def Cleanup(workDir: Path) -> None:
+    """Leave and delete a Workspace."""
+    os.chdir(ROOT)
+    shutil.rmtree(workDir, ignore_errors=True)
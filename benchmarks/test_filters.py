@@ -0,0 +1,107 @@
+"""Check stats filters that combine entry, release and genre terms.
+
+Filters are run on a generated log and compared with a check of every entry against
+the generated metadata. Run from the repository root:
+
+    python benchmarks/test_filters.py
+"""
+
+import asyncio
+import unittest
+from datetime import date
+
+import common
+
+MIXED: str = "!stats popularity_tracks user:user1 genre:rock released:1990..2010 T25"
+WORK_DIR = None
+
+
+def setUpModule() -> None:
+    """Import the bot from a scratch dir holding a generated log and cache."""
+    global WORK_DIR
+    WORK_DIR = common.Workspace()
+    import Defines  # noqa: PLC0415
+
+    rows = common.GenerateRows(2000)
+    common.WriteUserData(Defines.USER_DATA_FILE, rows)
+    common.WriteCache(Defines.CACHE_FILE, rows)
+    Defines.SPOTIFY.Client = common.FakeSpotify()
+
+
+def tearDownModule() -> None:
+    """Remove the scratch dir."""
+    common.Cleanup(WORK_DIR)
+
+
+class TestCompileFilters(unittest.TestCase):
+    """Every term of a command is parsed on its own."""
+
+    def test_mixed_terms(self) -> None:
+        """An unquoted genre ends at the next term."""
+        from Stats import CompileFilters  # noqa: PLC0415
+
+        plan = CompileFilters(MIXED)
+        self.assertEqual(plan.Genre, "rock")
+        self.assertEqual(plan.StatCount, 25)
+        self.assertEqual(plan.Released, [(date(1990, 1, 1), date(2010, 12, 31))])
+        self.assertEqual(len(plan.EntryChecks), 1)
+
+    def test_quoted_genre(self) -> None:
+        """A quoted genre keeps its spaces."""
+        from Stats import CompileFilters  # noqa: PLC0415
+
+        plan = CompileFilters('!stats popularity_tracks genre:"indie rock" T5')
+        self.assertEqual(plan.Genre, "indie rock")
+        self.assertEqual(plan.StatCount, 5)
+
+
+class TestFilterData(unittest.TestCase):
+    """FilterData keeps exactly the matching entries and only resolves those it must."""
+
+    def test_mixed_filter(self) -> None:
+        """User, release and genre terms together."""
+        asyncio.run(self.CheckMixedFilter())
+
+    async def CheckMixedFilter(self) -> None:
+        """Filter the whole log and compare with the generated metadata."""
+        import GenreIndex  # noqa: PLC0415
+        import ReleaseIndex  # noqa: PLC0415
+        from Defines import GetUserData  # noqa: PLC0415
+        from MetadataCache import GetCache  # noqa: PLC0415
+        from SpotifyAccess import GetFullInfoBatch  # noqa: PLC0415
+        from Stats import FilterData, GetPopularityTracks, TrimResults  # noqa: PLC0415
+
+        data = await GetPopularityTracks(await GetUserData())
+        filtered = await FilterData(common.FakeMessage(MIXED), dict(data))
+
+        userTracks = {x.TrackId for x in data["Data"] if x.User == "user1"}
+        self.assertLessEqual(ReleaseIndex.RELEASE_INDEX.Known, userTracks)
+        self.assertLessEqual(set(GenreIndex.GENRE_INDEX.TrackArtist), userTracks)
+
+        await GetFullInfoBatch(userTracks)
+        cache = await GetCache()
+        low, high = date(1990, 1, 1).toordinal(), date(2010, 12, 31).toordinal()
+
+        def Matches(trackId: str) -> bool:
+            track = cache.Get("tracks", trackId)
+            artist = cache.Get("artists", track["artists"][0]["id"])
+            ordinal = track["album"]["release_ordinal"]
+            return low <= ordinal <= high and "rock" in " ".join(artist["genres"])
+
+        expected = dict(data)
+        TrimResults(
+            expected,
+            (
+                (entry, value)
+                for entry, value in data["Data"].items()
+                if entry.User == "user1" and Matches(entry.TrackId)
+            ),
+            25,
+            True,
+        )
+        self.assertTrue(expected["Filtered"])
+        self.assertEqual(filtered["Filtered"], expected["Filtered"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""Check the vectorised PrepDataFrame columns against the per row code they replaced.
+
+The replaced functions are kept below as the oracle. Frames are generated with missing
+users and tracks and repeated tracks, as object and as categorical columns, the
+way PrepDataFrame builds them. Run from the repository root:
+
+    python benchmarks/test_graphing.py
+"""
+
+import random
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import common
+
+FRAMES: int = 200
+WORK_DIR = None
+
+
+def setUpModule() -> None:
+    """Import the bot from a scratch dir, Defines reads its config on import."""
+    global WORK_DIR
+    WORK_DIR = common.Workspace()
+
+
+def tearDownModule() -> None:
+    """Remove the scratch dir."""
+    common.Cleanup(WORK_DIR)
+
+
+def UserTrackNum(frame: pd.DataFrame, track: str) -> int:
+    """Get the number of tracks a user has added before this one."""
+    trackRow = frame.loc[frame["track"] == track]
+    if trackRow.empty:
+        return 0
+    trackIDx = trackRow.index[0]
+    user = trackRow["user"].iloc[0]
+    prevEntries = frame.loc[(frame["user"] == user) & (frame.index < trackIDx)]
+    return len(prevEntries)
+
+
+def AvgPopularityAtRow(frame: pd.DataFrame, row: int, useFollowers: bool = False) -> float:
+    """Average popularity of all tracks up to and including this one."""
+    trackIdx = frame.index[row]
+    prevEntries = frame.loc[:trackIdx]
+    col = "popularity" if not useFollowers else "followers"
+    if len(prevEntries) == 0:
+        return 0.0
+    return round(prevEntries[col].sum() / len(prevEntries), 2)
+
+
+def GenerateFrame(rng: random.Random) -> pd.DataFrame:
+    """A log shaped frame with gaps and repeats."""
+    rows = rng.randint(1, 120)
+    users = [f"user{i}" for i in range(rng.randint(1, 8))]
+    tracks = [f"track{i}" for i in range(rng.randint(1, rows))]
+    return pd.DataFrame(
+        {
+            "user": [None if rng.random() < 0.05 else rng.choice(users) for _ in range(rows)],
+            "track": [None if rng.random() < 0.05 else rng.choice(tracks) for _ in range(rows)],
+            "popularity": [
+                np.nan if rng.random() < 0.05 else rng.uniform(0, 100) for _ in range(rows)
+            ],
+            "followers": [
+                np.nan if rng.random() < 0.05 else rng.uniform(0, 1e6) for _ in range(rows)
+            ],
+        },
+    )
+
+
+class TestVectorisedColumns(unittest.TestCase):
+    """UserTrackNums and RunningAvgPopularity match the per row oracle."""
+
+    def Check(self, frame: pd.DataFrame) -> None:
+        """Compare every derived column of one frame."""
+        from Graphing import RunningAvgPopularity, UserTrackNums  # noqa: PLC0415
+
+        self.assertEqual(
+            UserTrackNums(frame).tolist(),
+            [UserTrackNum(frame, x) for x in frame["track"]],
+        )
+        for useFollowers in (False, True):
+            self.assertEqual(
+                RunningAvgPopularity(frame, useFollowers).tolist(),
+                [AvgPopularityAtRow(frame, i, useFollowers) for i in range(len(frame))],
+            )
+
+    def test_generated_frames(self) -> None:
+        """Random frames, with object columns."""
+        rng = random.Random(0)
+        for i in range(FRAMES):
+            with self.subTest(frame=i):
+                self.Check(GenerateFrame(rng))
+
+    def test_categorical_frames(self) -> None:
+        """Random frames, with user and track categorical as in PrepDataFrame."""
+        rng = random.Random(1)
+        for i in range(FRAMES):
+            frame = GenerateFrame(rng)
+            frame["user"] = frame["user"].astype("category")
+            frame["track"] = frame["track"].astype("category")
+            with self.subTest(frame=i):
+                self.Check(frame)
+
+    def test_edge_cases(self) -> None:
+        """A single row, every user missing and every track missing."""
+        self.Check(
+            pd.DataFrame({"user": ["a"], "track": ["t"], "popularity": [5.0], "followers": [1.0]}),
+        )
+        self.Check(
+            pd.DataFrame(
+                {
+                    "user": [None, None, None],
+                    "track": ["t", "u", "t"],
+                    "popularity": [1.0, np.nan, 3.0],
+                    "followers": [np.nan, np.nan, np.nan],
+                },
+            ),
+        )
+        self.Check(
+            pd.DataFrame(
+                {
+                    "user": ["a", "b", "a"],
+                    "track": [None, None, None],
+                    "popularity": [1.0, 2.0, 3.0],
+                    "followers": [4.0, 5.0, 6.0],
+                },
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
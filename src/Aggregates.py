@@ -0,0 +1,152 @@
+"""Per playlist counters for stats, kept up to date as entries are logged."""
+
+import asyncio
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from Defines import GetUserDataStore, Status, TimeWindow, UserDataEntry
+from MetadataCache import GetCache
+from SpotifyAccess import GetFullInfo, GetFullInfoBatch
+
+
+@dataclass
+class PlaylistAggregates:
+    """Running counts of one playlist's log, successful additions unless noted."""
+
+    Users: Counter[str] = field(default_factory=Counter)
+    UserFirst: dict[str, UserDataEntry] = field(default_factory=dict)
+    Posters: set[str] = field(default_factory=set)
+    Artists: Counter[str] = field(default_factory=Counter)
+    ArtistFirst: dict[str, UserDataEntry] = field(default_factory=dict)
+    ArtistNames: set[str] = field(default_factory=set)
+    UserArtists: defaultdict[str, Counter[str]] = field(
+        default_factory=lambda: defaultdict(Counter),
+    )
+    Statuses: Counter[Status] = field(default_factory=Counter)
+    ArtistIds: Counter[str] = field(default_factory=Counter)
+    Genres: Counter[str] = field(default_factory=Counter)
+    UserGenres: defaultdict[str, Counter[str]] = field(
+        default_factory=lambda: defaultdict(Counter),
+    )
+
+    def Add(self, entry: UserDataEntry) -> None:
+        """Count an entry's user, artist and status.
+
+        Parameters
+        ----------
+        entry : UserDataEntry
+            newly logged entry
+        """
+        self.Statuses[entry.EntryStatus] += 1
+        self.Posters.add(entry.User)
+        self.ArtistNames.add(entry.Artist)
+        if not entry.EntryStatus.WasSuccessful:
+            return
+        self.Users[entry.User] += 1
+        self.UserFirst.setdefault(entry.User, entry)
+        self.Artists[entry.Artist] += 1
+        self.ArtistFirst.setdefault(entry.Artist, entry)
+        self.UserArtists[entry.User][entry.Artist] += 1
+
+    def AddMetadata(self, entry: UserDataEntry, info: dict[str, dict]) -> None:
+        """Count a successful entry's artist id and genres.
+
+        Parameters
+        ----------
+        entry : UserDataEntry
+            logged entry
+        info : dict[str, dict]
+            full info of the entry's track
+        """
+        if not info["artist"]:
+            return
+        self.ArtistIds[info["artist"]["id"]] += 1
+        for genre in info["artist"].get("genres", []):
+            self.Genres[genre] += 1
+            self.UserGenres[entry.User][genre] += 1
+
+    def ClearMetadata(self) -> None:
+        """Drop the counts derived from metadata."""
+        self.ArtistIds.clear()
+        self.Genres.clear()
+        self.UserGenres.clear()
+
+
+AGGREGATES: defaultdict[str, PlaylistAggregates] = defaultdict(PlaylistAggregates)
+AGGREGATE_STATE: dict[str, int | None] = {
+    "Generation": None,
+    "MetaVersion": None,
+    "Rows": 0,
+    "Resolved": 0,
+}
+AGGREGATE_LOCK: asyncio.Lock = asyncio.Lock()
+
+
+async def CountWindow(
+    playlistId: str | None,
+    window: TimeWindow,
+    withMetadata: bool,
+) -> PlaylistAggregates:
+    """Count a playlist's entries within a time window from scratch."""
+    aggregates = PlaylistAggregates()
+    entries = [x for x in (await GetUserDataStore()).Between(window) if x.PlaylistID == playlistId]
+    for entry in entries:
+        aggregates.Add(entry)
+    if withMetadata:
+        added = [x for x in entries if x.EntryStatus.WasSuccessful]
+        await GetFullInfoBatch(x.TrackId for x in added)
+        for entry in added:
+            aggregates.AddMetadata(entry, await GetFullInfo(entry.TrackId))
+    return aggregates
+
+
+async def GetAggregates(
+    playlistId: str | None,
+    withMetadata: bool = False,
+    window: TimeWindow | None = None,
+) -> PlaylistAggregates:
+    """Access a playlist's counters, counting any entries logged since the last call.
+
+    Parameters
+    ----------
+    playlistId : str | None
+        unique playlist id
+    withMetadata : bool, optional
+        also bring artist id and genre counts up to date, by default False
+    window : TimeWindow | None, optional
+        only count entries logged within this window, by default all of them
+
+    Returns
+    -------
+    PlaylistAggregates
+        counters for the playlist
+    """
+    if window is not None:
+        return await CountWindow(playlistId, window, withMetadata)
+    async with AGGREGATE_LOCK:
+        store = await GetUserDataStore()
+        cache = await GetCache()
+        if AGGREGATE_STATE["Generation"] != store.Generation:
+            AGGREGATES.clear()
+            AGGREGATE_STATE.update(Generation=store.Generation, Rows=0, Resolved=0)
+        for entry in store.Entries[AGGREGATE_STATE["Rows"] :]:
+            AGGREGATES[entry.PlaylistID].Add(entry)
+        AGGREGATE_STATE["Rows"] = len(store)
+
+        if withMetadata:
+            metaVersion = cache.Version
+            if AGGREGATE_STATE["MetaVersion"] != metaVersion:
+                for aggregates in AGGREGATES.values():
+                    aggregates.ClearMetadata()
+                AGGREGATE_STATE["Resolved"] = 0
+            rows = len(store)
+            pending = [
+                x
+                for x in store.Entries[AGGREGATE_STATE["Resolved"] : rows]
+                if x.EntryStatus.WasSuccessful
+            ]
+            await GetFullInfoBatch(x.TrackId for x in pending)
+            for entry in pending:
+                AGGREGATES[entry.PlaylistID].AddMetadata(entry, await GetFullInfo(entry.TrackId))
+            AGGREGATE_STATE.update(Resolved=rows, MetaVersion=metaVersion)
+    return AGGREGATES[playlistId]
@@ -1,12 +1,16 @@
 """Commands for spotify bot."""
 
-import copy
+import importlib.util
+import io
 import os
 import random
 import re
 import subprocess
 import sys
+import time
 from collections.abc import Callable
+from dataclasses import replace
+from datetime import datetime
 from pathlib import Path
 from typing import Any
 
@@ -18,20 +22,22 @@ from DataLogging import LogEntry
 from Defines import (
     COMMAND_KEY,
     CONFIG,
-    MASTER_GENRES,
     TEMP_USER_DATA_FILE,
     USER_DATA_FILE,
-    GetMemory,
+    FlushMemory,
     GetUserData,
+    GetUserDataStore,
     SaveConfig,
-    SaveMemory,
     Status,
     UserDataEntry,
 )
+from GenreIndex import OTHER_GENRE, GetGenreIndex
 from Graphing import GRAPHS, Graphs, PrepDataFrame, PrepUserData
+from MetadataCache import GetCache
+from Metrics import METRICS
 from SpotifyAccess import CreateUserPlaylist, GetAllTracks, GetArtistInfo
-from Stats import FilterData, UserStats
-from Utility import SendMessage
+from Stats import FilterData, FilterError, UserStats
+from Utility import CodeBlocks, ParseTimeWindow, SendMessage
 
 COMMANDS: dict[str, Callable] = {}
 STATS = [
@@ -44,6 +50,8 @@ STATS = [
     "posters",
     "graph",
 ]
+PROFILE_DIR: Path = USER_DATA_FILE.parent / "profiles"
+PROFILING: bool = False
 
 
 async def Graph(message: Message) -> None:
@@ -104,6 +112,7 @@ async def Refresh(message: Message) -> None:
 
     """
     await SendMessage("Resetting myself 🔫", message)
+    await FlushMemory()
     sys.exit(0)
 
 
@@ -114,6 +123,7 @@ async def Update(message: Message) -> None:
         message (Message): triggering message
 
     """
+    await FlushMemory()
     os.chdir(Path(__file__).parent.parent)
     results = subprocess.check_output(["git", "pull", "origin", "main"])  # noqa: S607
     await SendMessage(f"Pulled from Git: {results.decode('utf-8')}", message)
@@ -136,6 +146,120 @@ async def ListCommands(message: Message) -> None:
     await SendMessage(out, message)
 
 
+async def ShowMetrics(message: Message) -> None:
+    """Send command, handler, spotify, cache, save and graph timings.
+
+    Args:
+        message (Message): triggering message, `!metrics reset` starts counting afresh
+
+    """
+    if "reset" in message.content.split():
+        METRICS.Reset()
+        await SendMessage("Metrics reset", message, reply=True)
+        return
+    for block in CodeBlocks(METRICS.Summary()):
+        await SendMessage(block, message, reply=True)
+
+
+def IsAdmin(message: Message) -> bool:
+    """Whether the author's user id is listed under Admins in the config."""
+    return str(message.author.id) in {str(x) for x in CONFIG.get("Admins", [])}
+
+
+def TopFunctions(stats: dict, count: int) -> str:
+    """The count functions with the most cumulative time in pstats data, one per line."""
+    rows = sorted(stats.items(), key=lambda x: x[1][3], reverse=True)[:count]
+    lines = [f"{'cumul':>8} {'own':>8} {'calls':>7}  function"]
+    for (path, line, name), (_, calls, own, cumulative, _) in rows:
+        where = f"{Path(path).name}:{line}" if line else path
+        lines.append(f"{cumulative:7.3f}s {own:7.3f}s {calls:>7}  {name} ({where})")
+    return "\n".join(lines)
+
+
+def PruneProfiles() -> None:
+    """Delete all but the newest ProfileKeep profiles."""
+    profiles = sorted(PROFILE_DIR.iterdir(), key=lambda x: x.stat().st_mtime, reverse=True)
+    for old in profiles[CONFIG.get("ProfileKeep", 20) :]:
+        old.unlink(missing_ok=True)
+
+
+async def Profile(message: Message) -> None:
+    """Run a command under a profiler and send where its time went, admins only.
+
+    Uses pyinstrument's sampling profiler if it is installed, attaching its html
+    report, otherwise cProfile, attaching the .prof file for snakeviz or pstats.
+    Either way the profile covers everything the bot ran while the command was
+    awaiting, so other messages handled meanwhile show up too. Only one profile
+    runs at a time and only the newest ProfileKeep reports are kept.
+
+    Args:
+        message (Message): triggering message, `!profile !stats contrib` profiles
+            `!stats contrib`
+
+    """
+    global PROFILING
+    if not IsAdmin(message):
+        await SendMessage("Only admins can profile commands", message, reply=True)
+        return
+    inner = message.content.removeprefix(COMMAND_KEY + "profile").strip()
+    if not inner.startswith(COMMAND_KEY) or inner.startswith(COMMAND_KEY + "profile"):
+        await SendMessage(
+            f"Usage: {COMMAND_KEY}profile {COMMAND_KEY}<command> [args]",
+            message,
+            reply=True,
+        )
+        return
+    if PROFILING:
+        await SendMessage("A profile is already running", message, reply=True)
+        return
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    name = inner.split()[0].removeprefix(COMMAND_KEY)
+    dst = PROFILE_DIR / f"{name}_{datetime.now():%Y%m%d_%H%M%S}"
+    original = message.content
+    message.content = inner
+    PROFILING = True
+    start = time.perf_counter()
+    try:
+        if importlib.util.find_spec("pyinstrument") is not None:
+            from pyinstrument import Profiler  # noqa: PLC0415
+
+            sampler = Profiler(async_mode="enabled")
+            sampler.start()
+            try:
+                await HandleCommands(message)
+            finally:
+                sampler.stop()
+            dst = dst.with_suffix(".html")
+            dst.write_text(sampler.output_html(), encoding="utf-8")
+            top = sampler.output_text(unicode=False, color=False, show_all=False)
+            # the call tree, trimmed to what fits in a message
+            top = "\n".join(top.splitlines()[: CONFIG.get("ProfileTop", 15) + 5])
+        else:
+            # profilers are only imported once someone profiles
+            import cProfile  # noqa: PLC0415
+            import pstats  # noqa: PLC0415
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await HandleCommands(message)
+            finally:
+                profiler.disable()
+            dst = dst.with_suffix(".prof")
+            profiler.dump_stats(dst)
+            stats = pstats.Stats(profiler, stream=io.StringIO())
+            rows = stats.stats  # type: ignore[attr-defined]
+            top = TopFunctions(rows, CONFIG.get("ProfileTop", 15))
+    finally:
+        message.content = original
+        PROFILING = False
+    await message.reply(
+        f"{inner} took {time.perf_counter() - start:.2f}s\n```\n{top[:1800]}\n```",
+        file=File(dst),
+    )
+    PruneProfiles()
+
+
 async def Data(message: Message) -> None:
     """Send the user data file.
 
@@ -193,27 +317,27 @@ async def Blame(message: Message) -> None:
     """
     author = str(message.author).split("#", maxsplit=1)[0]
     for trackID in re.findall(CONFIG["Regex"]["track"], message.content):
-        for entry in [
-            x for x in await GetUserData() if x.EntryStatus.WasSuccessful and x.TrackId == trackID
-        ]:
-            newEntry = copy.deepcopy(entry)
-            newEntry.Bonus = f"Blame from {author}"
-            newEntry.EntryStatus = Status.Blamed
+        for entry in (await GetUserDataStore()).Successes(trackID):
             if author == entry.User:
                 await SendMessage(
                     "You added this one, double blame for you!!",
                     message,
                     reply=True,
                 )
-                await LogEntry(newEntry, False)
-                await LogEntry(newEntry, False)
+                blames = 2
             else:
                 await SendMessage(
                     f"You can blame {entry.User} for {entry.TrackInfo}",
                     message,
                     reply=True,
                 )
-                await LogEntry(newEntry, False)
+                blames = 1
+            # each logged row gets its own entry, the store keys entries by row
+            for _ in range(blames):
+                await LogEntry(
+                    replace(entry, Bonus=f"Blame from {author}", EntryStatus=Status.Blamed),
+                    False,
+                )
 
 
 async def Praise(message: Message) -> None:
@@ -225,9 +349,7 @@ async def Praise(message: Message) -> None:
     """
     author = str(message.author).split("#", maxsplit=1)[0]
     for trackID in re.findall(CONFIG["Regex"]["track"], message.content):
-        for entry in [
-            x for x in await GetUserData() if x.EntryStatus.WasSuccessful and x.TrackId == trackID
-        ]:
+        for entry in (await GetUserDataStore()).Successes(trackID):
             if author == entry.User:
                 await SendMessage(
                     "You added this one, no praise for you!",
@@ -240,9 +362,11 @@ async def Praise(message: Message) -> None:
                     message,
                     reply=True,
                 )
-                newEntry = copy.deepcopy(entry)
-                newEntry.Bonus = f"Praise from {author}"
-                newEntry.EntryStatus = Status.Praised
+                newEntry = replace(
+                    entry,
+                    Bonus=f"Praise from {author}",
+                    EntryStatus=Status.Praised,
+                )
                 await LogEntry(newEntry, False)
 
 
@@ -254,12 +378,10 @@ async def Validate(message: Message) -> None:
 
     """
     missing: list[tuple[str, str, str]] = []
-    for idStr, m in (await GetMemory())["Cache"]["artists"].items():
-        if isinstance(m, list):
-            print(m, idStr)
-        else:
-            if not any(x in "".join(m["genres"]) for x in MASTER_GENRES):
-                missing.append((m["name"], idStr, m["genres"]))
+    cache = await GetCache()
+    for idStr in sorted((await GetGenreIndex()).ByMaster[OTHER_GENRE]):
+        if m := cache.Get("artists", idStr):
+            missing.append((m["name"], idStr, m["genres"]))
     await SendMessage(
         f"{len(missing)} Artists Missing Genres:\n - "
         + "\n - ".join(f"{x[0]} ({x[1]}) {x[2]}" for x in missing),
@@ -270,7 +392,7 @@ async def Validate(message: Message) -> None:
     playlistTracks = []
     found = 0
     if playlistID := CONFIG["Channel Maps"].get(message.channel.name, None):
-        playlistTracks = GetAllTracks(playlistID)
+        playlistTracks = await GetAllTracks(playlistID)
     for track in playlistTracks:
         if len([x for x in data if x.TrackId == track["track"]["id"]]) < 1:
             await SendMessage(
@@ -296,6 +418,7 @@ async def Kill(message: Message) -> None:
 
     """
     await SendMessage("", message)
+    await FlushMemory()
     sys.exit(0)
 
 
@@ -333,9 +456,10 @@ async def AddGenre(message: Message) -> None:
             ),
         )
 
+        (await GetGenreIndex()).SetArtist(artistID, info["genres"])
         await SendMessage(f"Genres for {info['name']} now {info['genres']}", message)
         if save:
-            await SaveMemory()
+            (await GetCache()).PutArtists({artistID: info})
     else:
         await SendMessage("Failed regex", message, reply=True)
 
@@ -343,6 +467,8 @@ async def AddGenre(message: Message) -> None:
 async def Playlist(message: Message) -> None:
     """Generate a random sample of the playlist."""
     data: list[UserDataEntry] = await GetUserData()
+    if (window := ParseTimeWindow(message.content)) is not None:
+        data = (await GetUserDataStore()).Between(window)
     valid = [x for x in data if x.EntryStatus == Status.Added]
     author = str(message.author).split("#", maxsplit=1)[0]
 
@@ -355,7 +481,11 @@ async def Playlist(message: Message) -> None:
         "Formatter": Formatter,
         "Unique": False,
     }
-    results = await FilterData(message, inputData)
+    try:
+        results = await FilterData(message, inputData)
+    except FilterError as e:
+        await SendMessage(str(e), message, reply=True)
+        return
     playlistId = await CreateUserPlaylist(
         author,
         message.content,
@@ -384,6 +514,8 @@ COMMANDS = {
     "stats": UserStats,
     "update": Update,
     "playlist": Playlist,
+    "metrics": ShowMetrics,
+    "profile": Profile,
 }
 
 
@@ -401,7 +533,8 @@ async def HandleCommands(message: Message) -> bool:
     handled = False
     for key, command in COMMANDS.items():
         if re.match(COMMAND_KEY + key, message.content):
-            await command(message)
+            with METRICS.Time("command_seconds", command=key):
+                await command(message)
             handled = True
             break
     if not handled and "!force" not in message.content:
@@ -2,7 +2,7 @@
 
 from datetime import datetime
 
-from Defines import UNAME_STAND_IN, AppendUserData, LoadUserData, Status, UserDataEntry
+from Defines import UNAME_STAND_IN, AppendUserData, Status, UserDataEntry
 
 
 async def LogUserData(
@@ -36,7 +36,6 @@ async def LogUserData(
         print(entry)
     else:
         AppendUserData(entry)
-        await LoadUserData()
 
 
 async def LogEntry(
@@ -46,7 +45,6 @@ async def LogEntry(
 ) -> None:
     """Write user data to a file."""
     AppendUserData(entry)
-    await LoadUserData()
 
 
 def GetResponse(result: Status, username: str, isTesting: bool) -> str:
@@ -1,20 +1,38 @@
 """Defines for Spoticord bot."""
 
 import asyncio
+import bisect
+import copy
 import csv
 import datetime
+import functools
+import gc
+import hashlib
+import itertools
+import json
+import os
+import shutil
 import sys
-from dataclasses import dataclass
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from enum import StrEnum
 from pathlib import Path
+from typing import Any
 
 import discord
+import numpy as np
 import spotipy
 from discord.ext import commands
 from spotipy.oauth2 import SpotifyOAuth
-from yaml import Dumper, dump
+from yaml import Dumper, YAMLError, dump
 from yaml import safe_load as load
 
+from LogReader import SEPARATOR, ReadUserDataLines, SplitUserData
+from Metrics import METRICS
+from SpotifyFixtures import FixtureStore, RecordingSpotify
+
 Dumper.ignore_aliases = lambda *_args: True  # pyright: ignore[reportAttributeAccessIssue] #ty:ignore
 
 
@@ -39,9 +57,16 @@ class Status(StrEnum):
         return self in [Status.Added, Status.ForceAdd]
 
 
-@dataclass
+STATUSES: dict[str, Status] = {x.value: x for x in Status}
+
+
+@dataclass(slots=True, eq=False)
 class UserDataEntry:
-    """Representation of 1 line of user data log."""
+    """Representation of 1 line of user data log.
+
+    Entries are identified by RowId, their position in the loaded log, which the store
+    assigns on append. Entries that were never stored fall back to object identity.
+    """
 
     Artist: str
     EntryStatus: Status
@@ -52,6 +77,7 @@ class UserDataEntry:
     User: str
     Bonus: str
     PlaylistID: str
+    RowId: int = field(default=-1, init=False, repr=False)
 
     @classmethod
     def FromList(cls, dataFields: list[str]) -> "UserDataEntry":
@@ -68,14 +94,14 @@ class UserDataEntry:
             instance of class
         """
         return cls(
-            PlaylistID=dataFields[0],
-            Artist=dataFields[6],
-            EntryStatus=Status(dataFields[3]),
+            PlaylistID=sys.intern(dataFields[0]),
+            Artist=sys.intern(dataFields[6]),
+            EntryStatus=STATUSES.get(dataFields[3]) or Status(dataFields[3]),
             TimeAdded=datetime.datetime.fromisoformat(dataFields[1]),
-            TrackId=dataFields[4],
+            TrackId=sys.intern(dataFields[4]),
             TrackName=dataFields[5],
             URI=dataFields[7],
-            User=dataFields[2],
+            User=sys.intern(dataFields[2]),
             Bonus=dataFields[8] if len(dataFields) > 8 else "",
         )
 
@@ -96,6 +122,27 @@ class UserDataEntry:
         dataFields = list(csv.reader([s], delimiter=SEPARATOR, quotechar='"'))[0]
         return cls.FromList(dataFields)
 
+    @property
+    def AsList(self) -> list[str]:
+        """Fields in data file column order, inverse of FromList.
+
+        Returns
+        -------
+        list[str]
+            list of dataFields
+        """
+        return [
+            self.PlaylistID,
+            str(self.TimeAdded),
+            self.User,
+            str(self.EntryStatus),
+            self.TrackId,
+            self.TrackName,
+            self.Artist,
+            self.URI,
+            self.Bonus,
+        ]
+
     @property
     def OutputString(self) -> str:
         """Output to be logged in datafile.csv.
@@ -142,27 +189,337 @@ class UserDataEntry:
         int
             hashed value
         """
-        return hash(self.OutputString)
+        return self.RowId if self.RowId >= 0 else id(self)
+
+    def __eq__(self, other: object) -> bool:
+        """Compare entries by log row.
+
+        Returns
+        -------
+        bool
+            both are the same row of the log
+        """
+        if not isinstance(other, UserDataEntry):
+            return NotImplemented
+        if self.RowId < 0 or other.RowId < 0:
+            return self is other
+        return self.RowId == other.RowId
+
+
+TimeWindow = tuple[datetime.datetime | None, datetime.datetime | None]
+
+
+class UserDataStore:
+    """In-memory user data log with hash indexes for the hot lookups.
+
+    Indexes are updated incrementally on every append so repeat checks, blame/praise
+    lookups and success counters never need to scan the whole log. Version is bumped
+    on every change and Generation only when the log is reloaded, so derived data can
+    tell an append (extend it) from a reload (rebuild it). Times keeps every entry's
+    time sorted with its position in TimeRows, so time ranges are found by bisect even
+    though blame and praise entries are logged with the time of the original addition.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty store."""
+        self.Entries: list[UserDataEntry] = []
+        self.ByPlaylistTrack: defaultdict[tuple[str, str], list[UserDataEntry]] = defaultdict(list)
+        self.ByTrack: defaultdict[str, list[UserDataEntry]] = defaultdict(list)
+        self.ByUser: defaultdict[str, list[UserDataEntry]] = defaultdict(list)
+        self.ByStatus: defaultdict[Status, list[UserDataEntry]] = defaultdict(list)
+        self.SuccessCount: int = 0
+        self.UserSuccessCount: Counter[str] = Counter()
+        self.Signature: tuple[int, int] | None = None
+        self.Version: int = 0
+        self.Generation: int = 0
+        self.Times: list[datetime.datetime] = []
+        self.TimeRows: list[int] = []
+        self.InTimeOrder: bool = True
+
+    def __len__(self) -> int:
+        """Return number of entries in the log."""
+        return len(self.Entries)
+
+    def Append(self, entry: UserDataEntry) -> None:
+        """Add an entry to the log and update every index.
+
+        Parameters
+        ----------
+        entry : UserDataEntry
+            entry to add
+        """
+        if self.Times and entry.TimeAdded < self.Times[-1]:
+            self.InTimeOrder = False
+            pos = bisect.bisect_right(self.Times, entry.TimeAdded)
+            self.Times.insert(pos, entry.TimeAdded)
+            self.TimeRows.insert(pos, len(self.Entries))
+        else:
+            self.Times.append(entry.TimeAdded)
+            self.TimeRows.append(len(self.Entries))
+        entry.RowId = len(self.Entries)
+        self.Entries.append(entry)
+        self.Version += 1
+        self.ByPlaylistTrack[(entry.PlaylistID, entry.TrackId)].append(entry)
+        self.ByTrack[entry.TrackId].append(entry)
+        self.ByUser[entry.User].append(entry)
+        self.ByStatus[entry.EntryStatus].append(entry)
+        if entry.EntryStatus.WasSuccessful:
+            self.SuccessCount += 1
+            self.UserSuccessCount[entry.User] += 1
+
+    def Clear(self) -> None:
+        """Remove all entries and reset every index."""
+        self.Entries.clear()
+        self.ByPlaylistTrack.clear()
+        self.ByTrack.clear()
+        self.ByUser.clear()
+        self.ByStatus.clear()
+        self.SuccessCount = 0
+        self.UserSuccessCount.clear()
+        self.Signature = None
+        self.Version += 1
+        self.Generation += 1
+        self.Times.clear()
+        self.TimeRows.clear()
+        self.InTimeOrder = True
+
+    def Rebuild(self, entries: Iterable[UserDataEntry]) -> None:
+        """Replace the contents of the store and rebuild all indexes.
+
+        Parameters
+        ----------
+        entries : Iterable[UserDataEntry]
+            full user data log
+        """
+        self.Clear()
+        for entry in entries:
+            self.Append(entry)
+
+    def Successes(self, trackId: str, playlistId: str | None = None) -> list[UserDataEntry]:
+        """Get successful additions of a track.
+
+        Parameters
+        ----------
+        trackId : str
+            unique track id
+        playlistId : str | None, optional
+            restrict to a single playlist, by default all playlists
+
+        Returns
+        -------
+        list[UserDataEntry]
+            successful entries in the order they were logged
+        """
+        entries = (
+            self.ByTrack.get(trackId, [])
+            if playlistId is None
+            else self.ByPlaylistTrack.get((playlistId, trackId), [])
+        )
+        return [x for x in entries if x.EntryStatus.WasSuccessful]
+
+    def RowsBetween(self, window: TimeWindow) -> range | list[int]:
+        """Get positions of the entries logged within a time window.
+
+        Parameters
+        ----------
+        window : TimeWindow
+            (since, until) where since is inclusive, until exclusive and None is open
+
+        Returns
+        -------
+        range | list[int]
+            matching positions in Entries in log order, a range when the log is in time order
+        """
+        since, until = window
+        low = 0 if since is None else bisect.bisect_left(self.Times, since)
+        high = len(self.Times) if until is None else bisect.bisect_left(self.Times, until)
+        high = max(low, high)
+        if self.InTimeOrder:
+            return range(low, high)
+        return sorted(self.TimeRows[low:high])
+
+    def Between(self, window: TimeWindow) -> list[UserDataEntry]:
+        """Get the entries logged within a time window, in log order."""
+        rows = self.RowsBetween(window)
+        if isinstance(rows, range):
+            return self.Entries[rows.start : rows.stop]
+        return [self.Entries[i] for i in rows]
+
+
+class AsyncSpotify:
+    """Awaitable facade over a blocking spotipy client.
+
+    Every method of the wrapped client is exposed as a coroutine that runs the
+    underlying request in a bounded thread pool, so slow Spotify responses never
+    block the discord event loop.
+    """
+
+    def __init__(self, client: spotipy.Spotify, concurrency: int) -> None:
+        """Wrap a spotipy client.
+
+        Parameters
+        ----------
+        client : spotipy.Spotify
+            blocking client to wrap
+        concurrency : int
+            max number of requests in flight at once
+        """
+        self.Client = client
+        self.Executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="spotify")
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        """Get an awaitable version of a client method."""
+        method = getattr(self.Client, name)
+
+        async def Call(*args: Any, **kwargs: Any) -> Any:
+            with METRICS.Time("spotify_request_seconds", endpoint=name):
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self.Executor,
+                        functools.partial(method, *args, **kwargs),
+                    )
+                except spotipy.exceptions.SpotifyException as e:
+                    METRICS.Count("spotify_errors_total", endpoint=name, status=str(e.http_status))
+                    raise
+
+        return Call
+
+
+class PersistenceManager:
+    """Write-behind persistence for the memory file.
+
+    Saves only mark memory as dirty, the actual write happens once after a debounce
+    delay or as soon as enough changes pile up. Writes are atomic and run in a worker
+    thread so disk access never blocks the event loop.
+    """
+
+    def __init__(self, delay: float, threshold: int) -> None:
+        """Create a persistence manager.
+
+        Parameters
+        ----------
+        delay : float
+            seconds to wait after the first change before flushing
+        threshold : int
+            number of pending changes that forces an immediate flush
+        """
+        self.Delay = delay
+        self.Threshold = threshold
+        self.Pending: int = 0
+        self.Task: asyncio.Task | None = None
+        self.Lock: asyncio.Lock = asyncio.Lock()
+
+    def MarkDirty(self) -> None:
+        """Record a change and schedule a flush."""
+        self.Pending += 1
+        if self.Task is None or self.Task.done():
+            self.Schedule(self.Delay if self.Pending < self.Threshold else 0.0)
+        elif self.Pending >= self.Threshold and not self.Lock.locked():
+            self.Task.cancel()
+            self.Schedule(0.0)
+
+    def Schedule(self, delay: float) -> None:
+        """Start a flush after delay seconds."""
+        self.Task = asyncio.get_running_loop().create_task(self.FlushAfter(delay))
+
+    async def FlushAfter(self, delay: float) -> None:
+        """Wait then flush, rescheduling if more changes came in meanwhile."""
+        await asyncio.sleep(delay)
+        await self.Flush()
+        if self.Pending:
+            self.Schedule(self.Delay)
+
+    async def Flush(self) -> None:
+        """Write memory to disk if anything changed."""
+        async with self.Lock:
+            if self.Pending == 0 or not MEMORY:
+                return
+            pending = self.Pending
+            self.Pending = 0
+            # snapshot on the loop, handlers keep changing the nested dicts while it is dumped
+            memory = copy.deepcopy(MEMORY)
+            try:
+                async with MEMORY_LOCK:
+                    with METRICS.Time("memory_flush_seconds"):
+                        size = await asyncio.get_running_loop().run_in_executor(
+                            None,
+                            WriteYaml,
+                            MEMORY_FILE,
+                            memory,
+                        )
+            except (OSError, YAMLError) as e:
+                # keep the changes pending so the next flush retries them
+                self.Pending += pending
+                print(f"Failed to save memory: {e!r}")
+                return
+            METRICS.Count("memory_flush_bytes_total", size)
+
+
+def WriteYaml(path: Path, data: Any) -> int:
+    """Atomically write data to a yaml file.
+
+    Parameters
+    ----------
+    path : Path
+        destination file
+    data : Any
+        yaml serialisable data
+
+    Returns
+    -------
+    int
+        size of the written file in bytes
+    """
+    tmpPath = path.with_name(path.name + ".tmp")
+    with tmpPath.open(encoding="utf-8", mode="w") as fp:
+        dump(data, fp, Dumper=Dumper)
+    os.replace(tmpPath, path)
+    return path.stat().st_size
 
 
 CACHE_FILE: Path = Path("data/cache.yml")
+CACHE_DB_FILE: Path = Path("data/cache.db")
 CONFIG_FILE: Path = Path("data/conf.yml" if len(sys.argv) < 2 else sys.argv[1])
 MEMORY_FILE: Path = Path("data/memory.yml" if len(sys.argv) < 3 else sys.argv[2])
 USER_DATA_FILE: Path = Path("data/user_data.csv")
 TEMP_USER_DATA_FILE: Path = Path("data/user_data_TEMP.csv")
+COLUMNAR_DIR: Path = Path("data/user_data_columns")
+COLUMNAR_TEXT_FIELDS: tuple[str, ...] = (
+    "PlaylistID",
+    "User",
+    "EntryStatus",
+    "TrackId",
+    "TrackName",
+    "Artist",
+    "URI",
+    "Bonus",
+)
+COLUMNAR_INTERNED_FIELDS: tuple[str, ...] = ("PlaylistID", "User", "TrackId", "Artist")
+COLUMNAR_FIELD_ORDER: tuple[str, ...] = (
+    "Artist",
+    "EntryStatus",
+    "TimeAdded",
+    "TrackId",
+    "TrackName",
+    "URI",
+    "User",
+    "Bonus",
+    "PlaylistID",
+)
 
 CACHE_LOCK: asyncio.Lock = asyncio.Lock()
 CONFIG_LOCK: asyncio.Lock = asyncio.Lock()
 MEMORY_LOCK: asyncio.Lock = asyncio.Lock()
 USER_DATA_FILE_LOCK: asyncio.Lock = asyncio.Lock()
+COMPACTION: asyncio.Future | None = None
+COMPACTED_ROWS: int = 0
 
 UNAME_STAND_IN: str = "UNAME_STAND_IN"
 COMMAND_KEY: str = "!"
-SEPARATOR: str = ","
 
 CONFIG: dict = load(CONFIG_FILE.read_text(encoding="utf-8"))
 MEMORY: dict = {}
-USER_DATA: list[UserDataEntry] = []
+USER_DATA: UserDataStore = UserDataStore()
 
 DISCORD_INTENTS: discord.Intents = discord.Intents.default()
 DISCORD_INTENTS.message_content = True
@@ -177,6 +534,16 @@ SPOTIFY_CLIENT: spotipy.Spotify = spotipy.Spotify(
         redirect_uri="http://127.0.0.1:3000",
     ),
 )
+SPOTIFY: AsyncSpotify = AsyncSpotify(
+    RecordingSpotify(SPOTIFY_CLIENT, FixtureStore(Path(CONFIG["SpotifyRecordDir"])))
+    if CONFIG.get("SpotifyRecordDir")
+    else SPOTIFY_CLIENT,
+    CONFIG.get("SpotifyConcurrency", 4),
+)
+PERSISTENCE: PersistenceManager = PersistenceManager(
+    CONFIG.get("SaveDelay", 30.0),
+    CONFIG.get("SaveThreshold", 100),
+)
 
 
 async def SaveConfig() -> None:
@@ -187,22 +554,23 @@ async def SaveConfig() -> None:
 
 
 async def SaveMemory() -> None:
-    """Save Memory to disk."""
-    async with CACHE_LOCK:
-        with CACHE_FILE.open(encoding="utf-8", mode="w") as fp:
-            dump(MEMORY["Cache"], fp, Dumper=Dumper)
-    async with MEMORY_LOCK:
-        with MEMORY_FILE.open(encoding="utf-8", mode="w") as fp:
-            dump(
-                {key: value for key, value in MEMORY.items() if key != "Cache"},
-                fp,
-                Dumper=Dumper,
-            )
+    """Mark memory as changed, it is written to disk shortly after."""
+    PERSISTENCE.MarkDirty()
+
+
+async def FlushMemory() -> None:
+    """Write any pending memory changes to disk now."""
+    await PERSISTENCE.Flush()
 
 
 async def GetUserData() -> list[UserDataEntry]:
     """Access user data, loads if not loaded yet."""
-    if USER_DATA == []:
+    return (await GetUserDataStore()).Entries
+
+
+async def GetUserDataStore() -> UserDataStore:
+    """Access indexed user data store, reloads if not loaded yet or changed on disk."""
+    if USER_DATA.Signature != UserDataFileSignature():
         await LoadUserData()
     return USER_DATA
 
@@ -214,16 +582,252 @@ async def GetMemory() -> dict:
     return MEMORY
 
 
+def ReadUserData(path: Path, start: int = 0, end: int | None = None) -> Iterator[UserDataEntry]:
+    """Stream entries from the log, optionally only the rows starting within a byte range."""
+    for row in csv.reader(ReadUserDataLines(path, start, end), delimiter=SEPARATOR, quotechar='"'):
+        if row:
+            yield UserDataEntry.FromList(row)
+
+
+def ParseUserDataChunk(path: Path, start: int = 0, end: int | None = None) -> list[UserDataEntry]:
+    """Parse the rows starting within a byte range.
+
+    Cyclic garbage collection is paused meanwhile, as entries hold no cycles and the
+    collector would otherwise rescan the growing list over and over.
+    """
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        return list(ReadUserData(path, start, end))
+    finally:
+        if wasEnabled:
+            gc.enable()
+
+
+async def ParseUserData(path: Path) -> list[UserDataEntry]:
+    """Parse the whole log off the event loop.
+
+    Logs of at least LoaderParallelBytes are split into byte ranges that LoaderWorkers
+    processes tokenise, the entries are then built in a thread. Smaller logs, or any log when
+    LoaderWorkers is below 2 (the default), are parsed in a thread.
+
+    Parameters
+    ----------
+    path : Path
+        user data log
+
+    Returns
+    -------
+    list[UserDataEntry]
+        every entry in log order
+    """
+    loop = asyncio.get_running_loop()
+    size = path.stat().st_size
+    workers = CONFIG.get("LoaderWorkers", 0)
+    if workers < 2 or size < CONFIG.get("LoaderParallelBytes", 64 * 1024 * 1024):
+        return await loop.run_in_executor(None, ParseUserDataChunk, path, 0, size)
+
+    rows = await SplitUserData(path, size, workers)
+    return await loop.run_in_executor(None, BuildUserDataEntries, rows)
+
+
+def BuildUserDataEntries(rows: Iterable[tuple[str, ...]]) -> list[UserDataEntry]:
+    """Build entries from split log rows, run in a thread as it takes as long as the split.
+
+    Parameters
+    ----------
+    rows : Iterable[tuple[str, ...]]
+        fields of every row in log order
+
+    Returns
+    -------
+    list[UserDataEntry]
+        every entry in log order
+    """
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [UserDataEntry.FromList(list(row)) for row in rows]
+    finally:
+        if wasEnabled:
+            gc.enable()
+
+
+def LogPrefixDigest(path: Path, size: int) -> str:
+    """Hash the first size bytes of the log, to tell if a snapshot still matches it."""
+    digest = hashlib.blake2b(digest_size=16)
+    with path.open(mode="rb") as fp:
+        while size > 0 and (block := fp.read(min(size, 1024 * 1024))):
+            digest.update(block)
+            size -= len(block)
+    return digest.hexdigest()
+
+
+def WriteLogSnapshot(entries: list[UserDataEntry], size: int) -> None:
+    """Compact the first size bytes of the log, parsed as entries, into a columnar snapshot.
+
+    Every text column is stored as uint32 codes into a vocabulary and times as
+    datetime64 microseconds, one .npy file per column, so the snapshot loads with a
+    memory map and no text parsing. The csv stays the complete log.
+
+    Parameters
+    ----------
+    entries : list[UserDataEntry]
+        entries parsed from the start of the log
+    size : int
+        bytes of the log the entries were parsed from
+    """
+    staging = COLUMNAR_DIR.with_name(COLUMNAR_DIR.name + ".tmp")
+    try:
+        if any(x.TimeAdded.tzinfo is not None for x in entries):
+            raise ValueError("log has timezone aware times")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        vocabularies: dict[str, list[str]] = {}
+        for name in COLUMNAR_TEXT_FIELDS:
+            codes: dict[str, int] = {}
+            np.save(
+                staging / f"{name}.npy",
+                np.fromiter(
+                    (codes.setdefault(getattr(x, name), len(codes)) for x in entries),
+                    dtype=np.uint32,
+                    count=len(entries),
+                ),
+            )
+            vocabularies[name] = [str(x) for x in codes]
+        np.save(
+            staging / "TimeAdded.npy",
+            np.array([x.TimeAdded for x in entries], dtype="datetime64[us]"),
+        )
+        (staging / "meta.json").write_text(
+            json.dumps(
+                {
+                    "rows": len(entries),
+                    "bytes": size,
+                    "digest": LogPrefixDigest(USER_DATA_FILE, size),
+                    "vocabularies": vocabularies,
+                },
+            ),
+            encoding="utf-8",
+        )
+        shutil.rmtree(COLUMNAR_DIR, ignore_errors=True)
+        staging.replace(COLUMNAR_DIR)
+        print(f"Compacted {len(entries)} log entries")
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Could not compact user data log: {e!r}")
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def ReadLogSnapshot(size: int) -> tuple[list[UserDataEntry], int] | None:
+    """Load the columnar snapshot if it is still a prefix of the log.
+
+    Parameters
+    ----------
+    size : int
+        current size of the log in bytes
+
+    Returns
+    -------
+    tuple[list[UserDataEntry], int] | None
+        snapshot entries and the log bytes they cover, None if missing or stale
+    """
+    if not (COLUMNAR_DIR / "meta.json").exists():
+        return None
+    try:
+        meta = json.loads((COLUMNAR_DIR / "meta.json").read_text(encoding="utf-8"))
+        if meta["bytes"] > size or LogPrefixDigest(USER_DATA_FILE, meta["bytes"]) != meta["digest"]:
+            return None
+        columns: dict[str, list] = {}
+        for name in COLUMNAR_TEXT_FIELDS:
+            vocabulary = meta["vocabularies"][name]
+            if name == "EntryStatus":
+                vocabulary = [STATUSES.get(x) or Status(x) for x in vocabulary]
+            elif name in COLUMNAR_INTERNED_FIELDS:
+                vocabulary = [sys.intern(x) for x in vocabulary]
+            # the store indexes UserDataEntry objects, so every row is built up front;
+            # the snapshot saves the csv parsing, not the objects
+            codes = np.load(COLUMNAR_DIR / f"{name}.npy", mmap_mode="r")
+            columns[name] = [vocabulary[i] for i in codes.tolist()]
+        columns["TimeAdded"] = np.load(COLUMNAR_DIR / "TimeAdded.npy", mmap_mode="r").astype(object)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Ignoring user data snapshot: {e!r}")
+        return None
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        entries = list(
+            itertools.starmap(
+                UserDataEntry,
+                zip(*(columns[x] for x in COLUMNAR_FIELD_ORDER), strict=True),
+            ),
+        )
+    finally:
+        if wasEnabled:
+            gc.enable()
+    return entries, meta["bytes"]
+
+
 async def LoadUserData() -> None:
-    """Load User data from disk."""
-    global USER_DATA
+    """Load User data from disk, unless another caller already did while this one waited.
+
+    With ColumnarLog enabled the start of the log comes from the columnar snapshot and
+    only the csv rows after it are parsed. The snapshot is rewritten in the background
+    once CompactEvery rows have piled up after it.
+    """
+    global COMPACTED_ROWS
     async with USER_DATA_FILE_LOCK:
-        with USER_DATA_FILE.open(encoding="utf-8") as csvFile:
-            USER_DATA = [
-                UserDataEntry.FromList(x)
-                for idx, x in enumerate(csv.reader(csvFile, delimiter=SEPARATOR, quotechar='"'))
-                if idx != 0 and x != []
-            ]
+        signature = UserDataFileSignature()
+        if USER_DATA.Signature == signature:
+            return
+        loop = asyncio.get_running_loop()
+        snapshot = None
+        if CONFIG.get("ColumnarLog", False):
+            snapshot = await loop.run_in_executor(None, ReadLogSnapshot, signature[1])
+        if snapshot is None:
+            entries = await ParseUserData(USER_DATA_FILE)
+            COMPACTED_ROWS = 0
+        else:
+            entries, offset = snapshot
+            tailEntries = await loop.run_in_executor(
+                None,
+                ParseUserDataChunk,
+                USER_DATA_FILE,
+                offset,
+                signature[1],
+            )
+            COMPACTED_ROWS = len(entries)
+            entries.extend(tailEntries)
+        USER_DATA.Rebuild(entries)
+        USER_DATA.Signature = signature
+        ScheduleCompaction()
+
+
+def ScheduleCompaction() -> None:
+    """Rewrite the columnar snapshot in the background once CompactEvery rows follow it.
+
+    Runs after every load and append, so a long running bot keeps its snapshot close to
+    the end of the log. Does nothing outside an event loop or while a rewrite is running.
+    """
+    global COMPACTION, COMPACTED_ROWS
+    if (
+        not CONFIG.get("ColumnarLog", False)
+        or USER_DATA.Signature is None
+        or len(USER_DATA) - COMPACTED_ROWS < CONFIG.get("CompactEvery", 5000)
+        or (COMPACTION is not None and not COMPACTION.done())
+    ):
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    # entries are never changed once logged, a shallow copy is a stable view of the log
+    COMPACTION = loop.run_in_executor(
+        None,
+        WriteLogSnapshot,
+        list(USER_DATA.Entries),
+        USER_DATA.Signature[1],
+    )
+    COMPACTED_ROWS = len(USER_DATA)
 
 
 async def LoadMemory() -> None:
@@ -232,20 +836,38 @@ async def LoadMemory() -> None:
     async with MEMORY_LOCK:
         with MEMORY_FILE.open(encoding="utf-8", mode="r") as fp:
             MEMORY = load(fp)
-        with CACHE_FILE.open(encoding="utf-8", mode="r") as fp:
-            MEMORY["Cache"] = load(fp)
+
+
+def UserDataFileSignature() -> tuple[int, int]:
+    """Get modification time and size of the user data log.
+
+    Returns
+    -------
+    tuple[int, int]
+        mtime in ns and size in bytes
+    """
+    stat = USER_DATA_FILE.stat()
+    return (stat.st_mtime_ns, stat.st_size)
 
 
 def AppendUserData(data: UserDataEntry) -> None:
-    """Write to last line of user data log.
+    """Write to last line of user data log and add it to the in-memory store.
+
+    If the log was changed externally since it was last read, the store is left
+    stale so the next access reparses the whole file.
 
     Parameters
     ----------
-    data : str
+    data : UserDataEntry
         input data from logging
     """
+    inSync = USER_DATA.Signature is not None and USER_DATA.Signature == UserDataFileSignature()
     with USER_DATA_FILE.open(mode="a", encoding="utf-8") as fp:
         fp.write("\n" + data.OutputString)
+    if inSync:
+        USER_DATA.Append(data)
+        USER_DATA.Signature = UserDataFileSignature()
+        ScheduleCompaction()
 
 
 MASTER_GENRES = [
@@ -0,0 +1,154 @@
+"""Inverted index from genres to the artists tagged with them, and tracks to their artist."""
+
+import asyncio
+from collections import defaultdict
+from collections.abc import Iterable
+
+from Defines import MASTER_GENRES, UserDataEntry
+from MetadataCache import GetCache
+from SpotifyAccess import GetFullInfoBatch
+
+OTHER_GENRE: str = "Other"
+
+
+def ClassifyGenres(genres: list[str]) -> set[str]:
+    """Master genres contained in an artist's genres.
+
+    Parameters
+    ----------
+    genres : list[str]
+        spotify genres of the artist
+
+    Returns
+    -------
+    set[str]
+        matching entries of MASTER_GENRES, OTHER_GENRE if there are none
+    """
+    joined = "".join(genres)
+    return {x for x in MASTER_GENRES if x in joined} or {OTHER_GENRE}
+
+
+class GenreIndex:
+    """Artists by genre and master genre, and the first artist of each resolved track.
+
+    Artist genres come from the metadata cache and are kept current by watching it.
+    Tracks are resolved to their first artist as callers ask about them. Version is
+    bumped whenever an indexed artist's genres change, e.g. by !addGenre without save.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty index."""
+        self.ArtistGenres: dict[str, list[str]] = {}
+        self.ArtistMasters: dict[str, set[str]] = {}
+        self.ByGenre: defaultdict[str, set[str]] = defaultdict(set)
+        self.ByMaster: defaultdict[str, set[str]] = defaultdict(set)
+        self.TrackArtist: dict[str, str] = {}
+        self.MetaVersion: int | None = None
+        self.Matches: dict[str, set[str]] = {}
+        self.Version: int = 0
+
+    def SetArtist(self, artistId: str, genres: list[str]) -> None:
+        """Index or re-index an artist's genres.
+
+        Parameters
+        ----------
+        artistId : str
+            unique artist id
+        genres : list[str]
+            the artist's full genre list
+        """
+        if artistId in self.ArtistGenres and self.ArtistGenres[artistId] != list(genres):
+            self.Version += 1
+        for genre in self.ArtistGenres.get(artistId, []):
+            self.ByGenre[genre].discard(artistId)
+        for master in self.ArtistMasters.get(artistId, set()):
+            self.ByMaster[master].discard(artistId)
+        self.ArtistGenres[artistId] = list(genres)
+        self.ArtistMasters[artistId] = ClassifyGenres(genres)
+        for genre in genres:
+            self.ByGenre[genre].add(artistId)
+        for master in self.ArtistMasters[artistId]:
+            self.ByMaster[master].add(artistId)
+        self.Matches.clear()
+
+    def WatchArtists(self, artists: dict[str, dict]) -> None:
+        """Index artists as they are stored in the metadata cache."""
+        for artistId, artist in artists.items():
+            self.SetArtist(artistId, artist["genres"])
+
+    def ArtistsMatching(self, text: str) -> set[str]:
+        """Artists with text anywhere in their space joined genres.
+
+        Parameters
+        ----------
+        text : str
+            genre or part of one
+
+        Returns
+        -------
+        set[str]
+            matching artist ids
+        """
+        if text not in self.Matches:
+            self.Matches[text] = {
+                artistId
+                for artistId, genres in self.ArtistGenres.items()
+                if text in " ".join(genres)
+            }
+        return self.Matches[text]
+
+    def ArtistOf(self, entry: UserDataEntry) -> str | None:
+        """Id of the entry's track's first artist, None if it could not be resolved."""
+        return self.TrackArtist.get(entry.TrackId)
+
+    def Reset(self, metaVersion: int) -> None:
+        """Forget resolved tracks after cached metadata was overwritten."""
+        self.TrackArtist.clear()
+        self.MetaVersion = metaVersion
+
+
+GENRE_INDEX: GenreIndex | None = None
+GENRE_INDEX_LOCK: asyncio.Lock = asyncio.Lock()
+
+
+async def GetGenreIndex(trackIds: Iterable[str] = ()) -> GenreIndex:
+    """Access the genre index, building it from the artist cache if not done yet.
+
+    Parameters
+    ----------
+    trackIds : Iterable[str], optional
+        tracks to resolve to their first artist if not done yet, by default none
+
+    Returns
+    -------
+    GenreIndex
+        the genre index
+    """
+    global GENRE_INDEX
+    async with GENRE_INDEX_LOCK:
+        cache = await GetCache()
+        if GENRE_INDEX is None:
+            index = GenreIndex()
+            # watch before reading, artists stored while the read runs are then indexed,
+            # and are newer than what the read returns for them
+            cache.ArtistWatchers.append(index.WatchArtists)
+            try:
+                artists = await cache.LoadItems("artists")
+            except BaseException:
+                cache.ArtistWatchers.remove(index.WatchArtists)
+                raise
+            for artistId, artist in artists:
+                if artistId not in index.ArtistGenres:
+                    index.SetArtist(artistId, artist["genres"])
+            GENRE_INDEX = index
+
+        if GENRE_INDEX.MetaVersion != cache.Version:
+            GENRE_INDEX.Reset(cache.Version)
+        pending = {str(x) for x in trackIds} - GENRE_INDEX.TrackArtist.keys()
+        if pending:
+            await GetFullInfoBatch(pending)
+        for trackId in pending:
+            track = cache.Get("tracks", trackId)
+            if track and track["artists"]:
+                GENRE_INDEX.TrackArtist[trackId] = str(track["artists"][0]["id"])
+    return GENRE_INDEX
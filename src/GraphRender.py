@@ -0,0 +1,225 @@
+"""Figure building and image rendering for graphs, run in worker processes.
+
+Nothing here touches discord, spotify or the bot config so workers stay cheap to start.
+"""
+
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+
+def PopularityFigure(data: pd.DataFrame, useFollowers: bool, colors: dict) -> Any:
+    """Popularity of each track in order added."""
+    return px.scatter(
+        data,
+        x=data.index,
+        y="popularity" if not useFollowers else "followers",
+        color="user",
+        trendline="lowess",
+        log_y=useFollowers,
+        color_discrete_map=colors,
+    )
+
+
+def UserPopularityFigure(data: pd.DataFrame, useFollowers: bool, colors: dict) -> Any:
+    """Popularity of each track against how many tracks the user had added."""
+    return px.scatter(
+        data,
+        x="userCount",
+        y="popularity" if not useFollowers else "followers",
+        color="user",
+        log_y=useFollowers,
+        trendline="lowess",
+        color_discrete_map=colors,
+    )
+
+
+def TotalAverageFigure(data: pd.DataFrame, useFollowers: bool, _colors: dict) -> Any:
+    """Running average popularity of the playlist."""
+    return px.scatter(
+        data,
+        x=data.index,
+        y="average" if not useFollowers else "followers_average",
+        log_y=useFollowers,
+        trendline="lowess",
+    )
+
+
+def ProgressFigure(data: pd.DataFrame, _useFollowers: bool, colors: dict) -> Any:
+    """Playlist length over time."""
+    return px.scatter(
+        data,
+        x="time",
+        y=data.index,
+        color="user",
+        color_discrete_map=colors,
+    )
+
+
+def UsersFigure(data: pd.DataFrame, _useFollowers: bool, colors: dict) -> Any:
+    """Share of tracks per user."""
+    return px.pie(
+        data,
+        names="names",
+        values="count",
+        color="names",
+        color_discrete_map=colors,
+    )
+
+
+def UserBarFigure(column: str) -> Callable[[pd.DataFrame, bool, dict], Any]:
+    """Bar chart of a per user column."""
+
+    def Figure(data: pd.DataFrame, _useFollowers: bool, colors: dict) -> Any:
+        return px.bar(
+            data,
+            x="names",
+            y=column,
+            color="names",
+            color_discrete_map=colors,
+        )
+
+    return Figure
+
+
+def TotalsFigure(data: pd.DataFrame, useFollowers: bool, colors: dict) -> Any:
+    """Popularity distribution per user."""
+    return px.box(
+        data,
+        x="user",
+        log_y=useFollowers,
+        y="popularity" if not useFollowers else "followers",
+        color="user",
+        color_discrete_map=colors,
+        points="all",
+    )
+
+
+def HeatFigure(data: pd.DataFrame, _useFollowers: bool, _colors: dict) -> Any:
+    """Density of popularity in order added."""
+    return px.density_heatmap(
+        data,
+        x=data.index,
+        y="popularity",
+        nbinsx=50,
+        nbinsy=10,
+    )
+
+
+def GenresFigure(data: pd.DataFrame, _useFollowers: bool, _colors: dict) -> Any:
+    """Pie chart of genre distribution."""
+    fig = px.pie(
+        names=list(data["names"]),
+        values=list(data["values"]),
+        title="Genre Distribution",
+        color_discrete_sequence=px.colors.qualitative.Light24,
+    )
+    fig.update_layout(showlegend=False)
+    fig.update_traces(
+        textinfo="label+percent",
+        textposition="inside",
+    )
+    return fig
+
+
+def TimelineFigure(data: pd.DataFrame, _useFollowers: bool, colors: dict) -> Any:
+    """Release dates of tracks per user."""
+    return px.box(
+        data,
+        y="user",
+        x="release_date",
+        orientation="h",
+        color="user",
+        points="all",
+        color_discrete_map=colors,
+    )
+
+
+def DurationFigure(data: pd.DataFrame, _useFollowers: bool, colors: dict) -> Any:
+    """Track durations per user."""
+    fig = px.box(
+        data,
+        x="duration_minutes",
+        y="user",
+        orientation="h",
+        points="all",
+        color="user",
+        title="Track Duration Distribution",
+        labels={"duration_minutes": "Duration (minutes)"},
+        color_discrete_map=colors,
+    )
+    fig.update_layout(boxmode="group")
+    return fig
+
+
+FIGURES: dict[str, Callable[[pd.DataFrame, bool, dict], Any]] = {
+    "popularity": PopularityFigure,
+    "userPopularity": UserPopularityFigure,
+    "totalAverage": TotalAverageFigure,
+    "progress": ProgressFigure,
+    "users": UsersFigure,
+    "unique_artists": UserBarFigure("artist_ratio"),
+    "unique_genres": UserBarFigure("genre_ratio"),
+    "rating": UserBarFigure("overall_score"),
+    "totals": TotalsFigure,
+    "heat": HeatFigure,
+    "genres": GenresFigure,
+    "timeline": TimelineFigure,
+    "duration": DurationFigure,
+}
+
+
+def WarmRenderer() -> None:
+    """Start a persistent kaleido browser in this process so renders skip the startup."""
+    try:
+        import kaleido  # noqa: PLC0415
+
+        kaleido.start_sync_server(silence_warnings=True)
+    except (ImportError, AttributeError):
+        # kaleido < 1.0 keeps its own process alive without a server
+        pass
+    try:
+        pio.to_image(px.scatter(x=[0], y=[0]), format="png", width=16, height=16)
+    except Exception as e:  # noqa: BLE001
+        # a failed warm up must not break the pool, the real render will report it
+        print(f"Could not warm up renderer: {e!r}")
+
+
+def RenderGraph(
+    graph: str,
+    data: pd.DataFrame,
+    useFollowers: bool,
+    colors: dict,
+    dst: Path,
+) -> tuple[float, float]:
+    """Build a figure and write it as an image.
+
+    Parameters
+    ----------
+    graph : str
+        name of the figure in FIGURES
+    data : pd.DataFrame
+        prepared input data for the figure
+    useFollowers : bool
+        plot follower counts instead of popularity
+    colors : dict
+        user to colour map
+    dst : Path
+        image output path
+
+    Returns
+    -------
+    tuple[float, float]
+        seconds spent building and rendering
+    """
+    start = time.perf_counter()
+    fig = FIGURES[graph](data, useFollowers, colors)
+    fig.update_layout(xaxis={"categoryorder": "total ascending"})
+    built = time.perf_counter()
+    pio.write_image(fig, dst, format="png", width=960, height=540, scale=2)
+    return built - start, time.perf_counter() - built
@@ -1,19 +1,42 @@
 """Graphing functions for playlist data."""
 
+import asyncio
+import csv
+import hashlib
 import inspect
-import re
+import os
+import time
+import uuid
+from collections import defaultdict, deque
 from collections.abc import Callable
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import fields
 from datetime import date
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
 from discord import Message
 
-from Defines import CONFIG, MASTER_GENRES, TEMP_USER_DATA_FILE, USER_DATA_FILE, Status
-from SpotifyAccess import GetFullInfo
+from Defines import (
+    CONFIG,
+    MASTER_GENRES,
+    SEPARATOR,
+    TEMP_USER_DATA_FILE,
+    USER_DATA_FILE,
+    GetUserDataStore,
+    Status,
+    UserDataEntry,
+)
+from GenreIndex import OTHER_GENRE, GetGenreIndex
+from GraphRender import FIGURES, RenderGraph, WarmRenderer
+from MetadataCache import GetCache
+from Metrics import METRICS
+from SpotifyAccess import GetFullInfo, GetFullInfoBatch
+from Utility import ParseTimeWindow
+from Workers import WorkerPool
 
 GRAPHS: list[str] = [
     "userPopularity",
@@ -26,95 +49,79 @@ GRAPHS: list[str] = [
     "unique",
     "genres",
 ]
+GRAPH_DIR: Path = USER_DATA_FILE.parent / "graphs"
+CATEGORICAL_COLUMNS: list[str] = ["user", "artist", "track", "playlistID"]
+FRAME_CACHE: dict[str, Any] = {}
+USER_FRAME_CACHE: dict[tuple, pd.DataFrame] = {}
+RENDER_POOL: Executor | None = None
+RENDER_TIMINGS: defaultdict[str, deque[tuple[float, float]]] = defaultdict(
+    lambda: deque(maxlen=50),
+)
 
 
-async def GraphDurations(valid: pd.DataFrame) -> Any:
-    """Generate a histogram of track durations."""
+def GetRenderPool() -> Executor:
+    """Access the graph rendering process pool, starts it if not running yet."""
+    global RENDER_POOL
+    if RENDER_POOL is None:
+        RENDER_POOL = WorkerPool(CONFIG.get("GraphWorkers", 2), initializer=WarmRenderer)
+    return RENDER_POOL
+
+
+def ResetRenderPool() -> None:
+    """Drop a broken render pool so the next graph starts a fresh one."""
+    global RENDER_POOL
+    if RENDER_POOL is not None:
+        RENDER_POOL.shutdown(wait=False, cancel_futures=True)
+        RENDER_POOL = None
+
+
+def WarmRenderPool() -> None:
+    """Start every render worker now so the first graph does not pay for browser startup."""
+    pool = GetRenderPool()
+    for _ in range(CONFIG.get("GraphWorkers", 2)):
+        pool.submit(time.sleep, 0)
+
+
+async def WithDurations(valid: pd.DataFrame) -> pd.DataFrame:
+    """Add track durations in minutes."""
     durations = []
+    await GetFullInfoBatch(valid["track"].astype(str))
     for track in valid["track"]:
         info = await GetFullInfo(str(track))
         duration_ms = info["track"].get("duration_ms", 0)
         durations.append(duration_ms / 60000)  # Convert to minutes
     valid = valid.copy()
     valid["duration_minutes"] = durations
-    fig = px.box(
-        valid,
-        x="duration_minutes",
-        y="user",
-        orientation="h",
-        points="all",
-        color="user",
-        title="Track Duration Distribution",
-        labels={"duration_minutes": "Duration (minutes)"},
-        color_discrete_map=CONFIG["UserColors"],
-    )
-    fig.update_layout(boxmode="group")
-    return fig
+    return valid
 
 
-async def GraphGenres(valid: pd.DataFrame) -> Any:
-    """Generate a pie chart of genre distribution."""
-    genreFreq = dict.fromkeys([*MASTER_GENRES, "Other"], 0)
-    for track in valid["track"]:
-        trackInfo = await GetFullInfo(str(track))
-        genres = "".join(trackInfo["artist"].get("genres", []))
-        matched = False
-        for genre in MASTER_GENRES:
-            if genre in "".join(genres):
-                genreFreq[genre] += 1
-                matched = True
-        if not matched:
-            genreFreq["Other"] += 1
-
-    fig = px.pie(
-        names=list(genreFreq.keys()),
-        values=list(genreFreq.values()),
-        title="Genre Distribution",
-        color_discrete_sequence=px.colors.qualitative.Light24,
-    )
-    fig.update_layout(showlegend=False)
-    fig.update_traces(
-        textinfo="label+percent",
-        textposition="inside",
-    )
-    return fig
+async def GenreFrequency(valid: pd.DataFrame) -> pd.DataFrame:
+    """Count tracks per master genre."""
+    genreFreq = dict.fromkeys([*MASTER_GENRES, OTHER_GENRE], 0)
+    tracks = valid["track"].astype(str).value_counts()
+    index = await GetGenreIndex(tracks.index)
+    for track, count in tracks.items():
+        artistId = index.TrackArtist.get(track)
+        for genre in index.ArtistMasters.get(artistId, {OTHER_GENRE}):
+            genreFreq[genre] += count
+    return pd.DataFrame({"names": list(genreFreq.keys()), "values": list(genreFreq.values())})
 
 
-async def GraphTimeline(valid: pd.DataFrame) -> Any:
-    """Generate a timeline graph of when tracks were released."""
-    release_dates = []
-    for track in valid["track"]:
-        info = await GetFullInfo(str(track))
-        date_str = info["track"]["album"].get("release_date", "")
-        match = re.match(r"(\d+)-?(\d*)-?(\d*)", date_str)
-        if match:
-            year, month, day = [int(x) if x.isnumeric() and x else 1 for x in match.groups()]
-            release = date(year=year, month=month, day=day)
-        else:
-            release = date.today()
-        release_dates.append(release.isoformat())
+async def WithReleaseDates(valid: pd.DataFrame) -> pd.DataFrame:
+    """Add track release dates as iso strings, unknown dates shown as today."""
     valid = valid.copy()
-    valid["release_date"] = release_dates
-    return px.box(
-        valid,
-        y="user",
-        x="release_date",
-        orientation="h",
-        color="user",
-        points="all",
-        color_discrete_map=CONFIG["UserColors"],
+    valid["release_date"] = valid["released"].map(
+        lambda x: date.fromordinal(int(x)).isoformat() if pd.notna(x) else date.today().isoformat(),
     )
+    return valid
 
 
-def UserTrackNum(frame: pd.DataFrame, track: str) -> int:
-    """Get the number of tracks a user has added before this one."""
-    trackRow = frame.loc[frame["track"] == track]
-    if trackRow.empty:
-        return 0
-    trackIDx = trackRow.index[0]
-    user = trackRow["user"].iloc[0]
-    prevEntries = frame.loc[(frame["user"] == user) & (frame.index < trackIDx)]
-    return len(prevEntries)
+def UserTrackNums(frame: pd.DataFrame) -> pd.Series:
+    """Get the number of tracks a user had added before each track was first added."""
+    previous = frame.groupby("user", sort=False).cumcount().reindex(frame.index, fill_value=0)
+    firstAdds = frame["track"].notna() & ~frame["track"].duplicated()
+    atFirstAdd = pd.Series(previous[firstAdds].to_numpy(), index=frame.loc[firstAdds, "track"])
+    return frame["track"].map(atFirstAdd).fillna(0).astype(int)
 
 
 async def PopularityRanking(track: str, useFollowers: bool = False) -> float:
@@ -132,25 +139,86 @@ async def PopularityRanking(track: str, useFollowers: bool = False) -> float:
     return val
 
 
-def AvgPopularityAtRow(frame: pd.DataFrame, row: int, useFollowers: bool = False) -> float:
-    """Average popularity of all tracks up to and including this one."""
-    trackIdx = frame.index[row]
-    prevEntries = frame.loc[:trackIdx]
+async def ReleaseOrdinal(track: str | None) -> int | None:
+    """Get the parsed release day of a track's album as an ordinal."""
+    try:
+        return (await GetFullInfo(track))["track"]["album"].get("release_ordinal")
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def RunningAvgPopularity(frame: pd.DataFrame, useFollowers: bool = False) -> pd.Series:
+    """Average popularity of all tracks up to and including each row."""
     col = "popularity" if not useFollowers else "followers"
-    if len(prevEntries) == 0:
-        return 0.0
-    return round(prevEntries[col].sum() / len(prevEntries), 2)
+    totals = frame[col].fillna(0).cumsum()
+    return (totals / np.arange(1, len(frame) + 1)).round(2)
 
 
-async def PrepDataFrame(saveFile: bool = False) -> pd.DataFrame:
-    """Prepare the main dataframe with all calculated fields."""
-    df = pd.read_csv(USER_DATA_FILE)
+def DataFileColumns() -> list[str]:
+    """Get the column names from the header of the user data file."""
+    with USER_DATA_FILE.open(encoding="utf-8") as fp:
+        header = next(csv.reader(fp, delimiter=SEPARATOR, quotechar='"'), [])
+    width = len([x for x in fields(UserDataEntry) if x.init])
+    return (header + [f"Unnamed: {i}" for i in range(len(header), width)])[:width]
+
 
-    df["popularity"] = [await PopularityRanking(x) for x in df["track"]]
-    df["followers"] = [await PopularityRanking(x, True) for x in df["track"]]
-    df["userCount"] = [UserTrackNum(df, x) for x in df["track"]]
-    df["average"] = [AvgPopularityAtRow(df, i) for i in range(len(df))]
-    df["followers_average"] = [AvgPopularityAtRow(df, i, True) for i in range(len(df))]
+async def EntryFrame(entries: list[UserDataEntry], columns: list[str]) -> pd.DataFrame:
+    """Build the frame rows for log entries, with popularity columns filled in."""
+    frame = pd.DataFrame(
+        [[x or None for x in entry.AsList] for entry in entries],
+        columns=columns,
+        dtype=object,
+    )
+    await GetFullInfoBatch(frame["track"].dropna())
+    frame["popularity"] = [await PopularityRanking(x) for x in frame["track"]]
+    frame["followers"] = [await PopularityRanking(x, True) for x in frame["track"]]
+    frame["released"] = [await ReleaseOrdinal(x) for x in frame["track"]]
+    return frame
+
+
+async def PrepDataFrame(saveFile: bool = False) -> pd.DataFrame:
+    """Prepare the main dataframe with all calculated fields.
+
+    The frame is cached against the user data and metadata versions. New log entries
+    are appended to it, anything else (a reload or edited metadata) rebuilds it. The
+    returned frame is shared, so callers must not modify it in place.
+    """
+    store = await GetUserDataStore()
+    cache = await GetCache()
+    df: pd.DataFrame | None = FRAME_CACHE.get("Frame")
+    if (
+        df is None
+        or FRAME_CACHE["Generation"] != store.Generation
+        or FRAME_CACHE["MetaVersion"] != cache.Version
+    ):
+        df = None
+        FRAME_CACHE.clear()
+        USER_FRAME_CACHE.clear()
+
+    if df is None or FRAME_CACHE["Rows"] != len(store):
+        rows = FRAME_CACHE.get("Rows", 0)
+        # entries logged or a reload while metadata is fetched are left for the next call
+        end = len(store)
+        generation = store.Generation
+        columns = DataFileColumns() if df is None else FRAME_CACHE["Columns"]
+        new = await EntryFrame(store.Entries[rows:end], columns)
+        df = new if df is None else pd.concat([df, new], ignore_index=True)
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+        df["userCount"] = UserTrackNums(df)
+        df["average"] = RunningAvgPopularity(df)
+        df["followers_average"] = RunningAvgPopularity(df, True)
+        FRAME_CACHE.update(
+            {
+                "Frame": df,
+                "Rows": end,
+                "Columns": columns,
+                "Generation": generation,
+                "MetaVersion": cache.Version,
+            },
+        )
+        USER_FRAME_CACHE.clear()
 
     if saveFile:
         # Reset index and ensure columns are in the correct order before saving
@@ -171,11 +239,10 @@ def GetUniqueRatio(data: pd.DataFrame) -> float:
     return len(set(data)) / len(data) if len(data) > 1 else 0.0
 
 
-async def PrepUserData(df: pd.DataFrame, saveFile: bool = False) -> pd.DataFrame:
-    """Prepare the user-specific dataframe with all calculated fields."""
-    user_names = df["user"].unique()
-    users = pd.DataFrame({"names": user_names})
-    user_group = df.groupby("user")
+async def BuildUserData(df: pd.DataFrame) -> pd.DataFrame:
+    """Calculate per user aggregates for a frame from PrepDataFrame."""
+    users = pd.DataFrame({"names": list(df["user"].unique())})
+    user_group = df.groupby("user", observed=True)
     users["artists"] = users["names"].map(
         lambda user: user_group.get_group(user)["artist"].tolist(),
     )
@@ -184,6 +251,7 @@ async def PrepUserData(df: pd.DataFrame, saveFile: bool = False) -> pd.DataFrame
     )
 
     genres_list = []
+    await GetFullInfoBatch(df["track"].dropna())
     for user in users["names"]:
         genres = []
         for track in user_group.get_group(user)["track"]:
@@ -207,6 +275,24 @@ async def PrepUserData(df: pd.DataFrame, saveFile: bool = False) -> pd.DataFrame
         + users["genre_ratio"]
         - (abs(50 - users["median_popularity"]) / 50)
     )
+    return users
+
+
+async def PrepUserData(df: pd.DataFrame, saveFile: bool = False) -> pd.DataFrame:
+    """Prepare the user-specific dataframe with all calculated fields.
+
+    Results are cached per subset of the frame from PrepDataFrame until it changes.
+    """
+    key = (
+        FRAME_CACHE.get("Generation"),
+        FRAME_CACHE.get("Rows"),
+        FRAME_CACHE.get("MetaVersion"),
+        (await GetGenreIndex()).Version,
+        hash(df.index.to_numpy().tobytes()),
+    )
+    if (users := USER_FRAME_CACHE.get(key)) is None:
+        users = await BuildUserData(df)
+        USER_FRAME_CACHE[key] = users
 
     if saveFile:
         # Convert 'artists' and 'genres' columns to semicolon-separated strings for CSV output
@@ -218,9 +304,76 @@ async def PrepUserData(df: pd.DataFrame, saveFile: bool = False) -> pd.DataFrame
     return users
 
 
+async def DataVersion() -> str:
+    """Version of everything graphs are derived from: the user data log, metadata and genres."""
+    store = await GetUserDataStore()
+    cache = await GetCache()
+    genres = await GetGenreIndex()
+    last = store.Entries[-1].OutputString if store.Entries else ""
+    digest = hashlib.sha1(last.encode()).hexdigest()
+    return f"{len(store)}:{digest}:{cache.Version}:{genres.Version}"
+
+
+def GraphPath(
+    graph: str,
+    playlistID: str | None,
+    useFollowers: bool,
+    version: str,
+    rows: range | list[int] | None = None,
+) -> Path:
+    """Content addressed image path for a graph, rows being the time window's log rows."""
+    if isinstance(rows, list):
+        # a digest rather than the repr of what can be most of the log
+        rows = hashlib.sha1(np.asarray(rows, dtype=np.int64).tobytes()).hexdigest()
+    key = hashlib.sha256(
+        repr((graph, playlistID, useFollowers, version, rows)).encode(),
+    ).hexdigest()
+    return GRAPH_DIR / f"{graph}_{key[:24]}.png"
+
+
+def TrimGraphCache(limit: int) -> None:
+    """Delete least recently used graph images until the directory fits in limit bytes."""
+    images = sorted(
+        ((x.stat().st_mtime, x.stat().st_size, x) for x in GRAPH_DIR.glob("*.png")),
+    )
+    total = sum(x[1] for x in images)
+    for _, size, path in images:
+        if total <= limit:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
 async def Graphs(message: Message) -> list[Path]:
-    """Generate graphs based on user data and message content."""
+    """Generate graphs based on user data and message content.
+
+    Images are cached by graph, playlist, options and data version, so repeated requests
+    are answered from disk until something changes. Metadata lookups happen here, figure
+    building and rendering run in parallel in the render process pool so the event loop
+    stays free.
+    """
+    playlistID = CONFIG["Channel Maps"].get(message.channel.name, None)
+    useFollowers = " followers" in message.content
+    version = await DataVersion()
+    rows = None
+    if (window := ParseTimeWindow(message.content)) is not None:
+        rows = (await GetUserDataStore()).RowsBetween(window)
+    requested = {
+        graph: GraphPath(graph, playlistID, useFollowers, version, rows)
+        for graph in FIGURES
+        if graph in message.content or " all" in message.content
+    }
+    found = [dst for dst in requested.values() if dst.exists()]
+    for dst in found:
+        os.utime(dst)
+    missing = {graph: dst for graph, dst in requested.items() if dst not in found}
+    if not missing:
+        return found
+
     full = await PrepDataFrame()
+    if rows is not None:
+        # frame rows line up with the log, so the window selects them by position
+        full = full.iloc[rows]
     if "result" not in full.columns:
         raise ValueError("'result' column not found in user data.")
 
@@ -230,115 +383,74 @@ async def Graphs(message: Message) -> list[Path]:
         except Exception:
             return False
 
-    playlistID = CONFIG["Channel Maps"].get(message.channel.name, None)
     valid = full.loc[full["result"].apply(WasAdded)]
     valid = full.loc[full["playlistID"] == playlistID]
 
     if isinstance(valid, pd.Series):
         return []
+    valid = valid.assign(
+        **{
+            col: valid[col].cat.remove_unused_categories()
+            for col in CATEGORICAL_COLUMNS
+            if col in valid.columns
+        },
+    )
     users = await PrepUserData(valid)
 
     valid.reset_index(drop=True)
-    useFollowers = " followers" in message.content
-    graphs: dict[str, Callable] = {
-        "popularity": lambda: px.scatter(
-            valid,
-            x=valid.index,
-            y="popularity" if not useFollowers else "followers",
-            color="user",
-            trendline="lowess",
-            log_y=useFollowers,
-            color_discrete_map=CONFIG["UserColors"],
-        ),
-        "userPopularity": lambda: px.scatter(
-            valid,
-            x="userCount",
-            y="popularity" if not useFollowers else "followers",
-            color="user",
-            log_y=useFollowers,
-            trendline="lowess",
-            color_discrete_map=CONFIG["UserColors"],
-        ),
-        "totalAverage": lambda: px.scatter(
-            valid,
-            x=valid.index,
-            y="average" if not useFollowers else "followers_average",
-            log_y=useFollowers,
-            trendline="lowess",
-        ),
-        "progress": lambda: px.scatter(
-            valid,
-            x="time",
-            y=valid.index,
-            color="user",
-            color_discrete_map=CONFIG["UserColors"],
-        ),
-        "users": lambda: px.pie(
-            users,
-            names="names",
-            values="count",
-            color="names",
-            color_discrete_map=CONFIG["UserColors"],
-        ),
-        "unique_artists": lambda: px.bar(
-            users,
-            x="names",
-            y="artist_ratio",
-            color="names",
-            color_discrete_map=CONFIG["UserColors"],
-        ),
-        "unique_genres": lambda: px.bar(
-            users,
-            x="names",
-            y="genre_ratio",
-            color="names",
-            color_discrete_map=CONFIG["UserColors"],
-        ),
-        "rating": lambda: px.bar(
-            users,
-            x="names",
-            y="overall_score",
-            color="names",
-            color_discrete_map=CONFIG["UserColors"],
-        ),
-        "totals": lambda: px.box(
-            valid,
-            x="user",
-            log_y=useFollowers,
-            y="popularity" if not useFollowers else "followers",
-            color="user",
-            color_discrete_map=CONFIG["UserColors"],
-            points="all",
-        ),
-        "heat": lambda: px.density_heatmap(
-            valid,
-            x=valid.index,
-            y="popularity",
-            nbinsx=50,
-            nbinsy=10,
-        ),
-        "genres": GraphGenres,
-        "timeline": GraphTimeline,
-        "duration": GraphDurations,
+    inputs: dict[str, Callable] = {
+        "users": lambda: users,
+        "unique_artists": lambda: users,
+        "unique_genres": lambda: users,
+        "rating": lambda: users,
+        "genres": lambda: GenreFrequency(valid),
+        "timeline": lambda: WithReleaseDates(valid),
+        "duration": lambda: WithDurations(valid),
     }
-    (USER_DATA_FILE.parent / "graphs").mkdir(exist_ok=True)
+    GRAPH_DIR.mkdir(exist_ok=True)
+    loop = asyncio.get_running_loop()
     made: list[Path] = []
-    found: list[Path] = []
-    figs: list = []
-    for graph, func in graphs.items():
-        if graph in message.content or " all" in message.content:
-            dst = (
-                USER_DATA_FILE.parent / "graphs" / f"{graph}_{valid.shape[0]}x{valid.shape[1]}.png"
-            )
-            if dst.exists():
-                found.append(dst)
-            else:
-                _ = [x.unlink() for x in (USER_DATA_FILE.parent / "graphs").glob(f"{graph}_*")]
-                if inspect.iscoroutinefunction(func):
-                    figs.append(await func(valid))
-                else:
-                    figs.append(func())
-                figs[-1].update_layout(xaxis={"categoryorder": "total ascending"})
-                made.append(dst)
-    pio.write_images(fig=figs, file=made, width=960, height=540, scale=2)
+    rendering: list[tuple[str, Path, Path, asyncio.Future]] = []
+    for graph, dst in missing.items():
+        data = inputs.get(graph, lambda: valid)()
+        if inspect.isawaitable(data):
+            data = await data
+        # unique per render so identical concurrent requests never share a file, and
+        # not .png so TrimGraphCache leaves it alone
+        tmp = dst.with_name(f"{dst.stem}.{uuid.uuid4().hex}.tmp")
+        rendering.append(
+            (
+                graph,
+                dst,
+                tmp,
+                loop.run_in_executor(
+                    GetRenderPool(),
+                    RenderGraph,
+                    graph,
+                    data,
+                    useFollowers,
+                    CONFIG["UserColors"],
+                    tmp,
+                ),
+            ),
+        )
+    for graph, dst, tmp, future in rendering:
+        try:
+            buildTime, renderTime = await future
+            tmp.replace(dst)
+        except BrokenProcessPool as e:
+            print(f"Render pool died on {graph}: {e!r}")
+            tmp.unlink(missing_ok=True)
+            ResetRenderPool()
+            continue
+        except Exception as e:  # noqa: BLE001
+            print(f"Failed to render {graph}: {e!r}")
+            tmp.unlink(missing_ok=True)
+            continue
+        RENDER_TIMINGS[graph].append((buildTime, renderTime))
+        METRICS.Observe("graph_build_seconds", buildTime, graph=graph)
+        METRICS.Observe("graph_render_seconds", renderTime, graph=graph)
+        print(f"Rendered {graph} in {buildTime:.2f}s + {renderTime:.2f}s")
+        made.append(dst)
+    TrimGraphCache(CONFIG.get("GraphCacheBytes", 200 * 1024 * 1024))
     return found + made
@@ -0,0 +1,103 @@
+"""Split the user data log into fields, in parallel worker processes for large logs.
+
+Loader workers run the code here, so nothing here may import the rest of the bot.
+Building entries from the fields is left to Defines.
+"""
+
+import asyncio
+import csv
+import itertools
+from collections.abc import Iterator
+from pathlib import Path
+
+from Workers import WorkerPool
+
+SEPARATOR: str = ","
+USER_DATA_COLUMNS: int = 9
+COLUMN_JOIN: str = "\x1f"
+
+
+def ReadUserDataLines(path: Path, start: int = 0, end: int | None = None) -> Iterator[str]:
+    """Stream the raw rows of the log that start within a byte range, without the header.
+
+    Parameters
+    ----------
+    path : Path
+        user data log
+    start : int, optional
+        first byte of the range, by default the start of the file
+    end : int | None, optional
+        byte after the range, by default the end of the file
+
+    Returns
+    -------
+    Iterator[str]
+        decoded lines
+    """
+    with path.open(mode="rb") as fp:
+        if start > 0:
+            # finish the row running into the range, it belongs to the previous one
+            fp.seek(start - 1)
+        position = fp.tell() + len(fp.readline())
+        for line in fp:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line.decode("utf-8")
+
+
+def SplitUserDataChunk(path: Path, start: int, end: int) -> tuple[int, list[str]]:
+    """Split the rows starting within a byte range into fields, run in loader workers.
+
+    Fields come back as one string per column joined by COLUMN_JOIN, which crosses the
+    process boundary far cheaper than a list of objects per row.
+
+    Returns
+    -------
+    tuple[int, list[str]]
+        row count and joined columns
+    """
+    rows = csv.reader(ReadUserDataLines(path, start, end), delimiter=SEPARATOR, quotechar='"')
+    columns: list[list[str]] = [[] for _ in range(USER_DATA_COLUMNS)]
+    count = 0
+    for row in rows:
+        if row:
+            count += 1
+            row += [""] * (USER_DATA_COLUMNS - len(row))
+            for column, value in zip(columns, row, strict=False):
+                column.append(value)
+    return count, [COLUMN_JOIN.join(x) for x in columns]
+
+
+async def SplitUserData(path: Path, size: int, workers: int) -> Iterator[tuple[str, ...]]:
+    """Split the first size bytes of the log into fields across worker processes.
+
+    Parameters
+    ----------
+    path : Path
+        user data log
+    size : int
+        bytes of the log to read
+    workers : int
+        number of processes, each splitting an equal byte range
+
+    Returns
+    -------
+    Iterator[tuple[str, ...]]
+        fields of every row in log order
+    """
+    loop = asyncio.get_running_loop()
+    bounds = [size * i // workers for i in range(workers + 1)]
+    with WorkerPool(workers) as pool:
+        chunks = await asyncio.gather(
+            *(
+                loop.run_in_executor(pool, SplitUserDataChunk, path, start, end)
+                for start, end in itertools.pairwise(bounds)
+            ),
+        )
+    return (
+        row
+        for count, columns in chunks
+        if count
+        for row in zip(*(x.split(COLUMN_JOIN) for x in columns), strict=True)
+    )
@@ -0,0 +1,473 @@
+"""Pluggable storage for cached spotify metadata."""
+
+import asyncio
+import atexit
+import json
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator
+from datetime import date
+from pathlib import Path
+
+from more_itertools import chunked
+
+from Defines import CACHE_DB_FILE, CACHE_FILE, CACHE_LOCK, CONFIG, load
+
+KINDS: tuple[str, ...] = ("tracks", "albums", "artists")
+SCHEMA_VERSION: str = "3"
+
+
+def ParseReleaseDate(value: str) -> date | None:
+    """Parse a spotify release date of year, month or day precision.
+
+    Parameters
+    ----------
+    value : str
+        release date, e.g. 1999, 1999-05 or 1999-05-17
+
+    Returns
+    -------
+    date | None
+        first day of the given period, None if not a valid date
+    """
+    match = re.match(r"(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?", str(value or ""))
+    if not match:
+        return None
+    year, month, day = match.groups()
+    try:
+        return date(int(year), int(month or 1), int(day or 1))
+    except ValueError:
+        return None
+
+
+def SlimAlbum(raw: dict) -> dict:
+    """Reduce an album payload to the fields used by the bot, with the release date parsed."""
+    released = ParseReleaseDate(raw.get("release_date", ""))
+    return {
+        "id": str(raw.get("id", "")),
+        "name": raw.get("name", ""),
+        "release_date": raw.get("release_date", ""),
+        "release_year": released.year if released else None,
+        "release_ordinal": released.toordinal() if released else None,
+    }
+
+
+def SlimTrack(raw: dict) -> dict:
+    """Reduce a track payload to the fields used by the bot, album left embedded."""
+    trackId = str(raw.get("id", ""))
+    album = raw.get("album") or {}
+    album = SlimAlbum(album) if isinstance(album, dict) else {"id": str(album)}
+    album["id"] = album["id"] or f"track:{trackId}"
+    return {
+        "id": trackId,
+        "name": raw.get("name", ""),
+        "popularity": raw.get("popularity", 0),
+        "duration_ms": raw.get("duration_ms", 0),
+        "uri": raw.get("uri", ""),
+        "album": album,
+        "artists": [{"id": x["id"], "name": x["name"]} for x in raw.get("artists", [])],
+    }
+
+
+def SlimArtist(raw: dict) -> dict:
+    """Reduce an artist payload to the fields used by the bot."""
+    genres = raw.get("genres")
+    return {
+        "id": str(raw.get("id", "")),
+        "name": raw.get("name", ""),
+        "popularity": raw.get("popularity", 0),
+        "genres": list(genres) if isinstance(genres, list) else [],
+        "followers": {"total": (raw.get("followers") or {}).get("total", 0)},
+    }
+
+
+class CacheBackend(ABC):
+    """Key value store for slim spotify objects, grouped by kind (tracks, albums, artists).
+
+    Tracks reference their album, which is stored once and shared by every track on it.
+    Version is bumped whenever an already cached track or artist is overwritten, so
+    derived data only needs rebuilding when existing metadata changed. Indexes over
+    artists register in ArtistWatchers to be handed every artist as it is stored.
+    """
+
+    Version: int = 0
+
+    def __init__(self) -> None:
+        """Create the watcher list."""
+        self.ArtistWatchers: list[Callable[[dict[str, dict]], None]] = []
+
+    @abstractmethod
+    def Get(self, kind: str, key: str) -> dict | None:
+        """Get a single object.
+
+        Parameters
+        ----------
+        kind : str
+            object kind, one of KINDS
+        key : str
+            spotify id
+
+        Returns
+        -------
+        dict | None
+            cached object, None if not cached
+        """
+
+    @abstractmethod
+    def Put(self, kind: str, items: dict[str, dict]) -> None:
+        """Insert or replace many objects at once.
+
+        Parameters
+        ----------
+        kind : str
+            object kind, one of KINDS
+        items : dict[str, dict]
+            objects keyed by spotify id
+        """
+
+    @abstractmethod
+    def Missing(self, kind: str, keys: Iterable[str]) -> list[str]:
+        """Get which keys are not cached.
+
+        Parameters
+        ----------
+        kind : str
+            object kind, one of KINDS
+        keys : Iterable[str]
+            spotify ids to check
+
+        Returns
+        -------
+        list[str]
+            ids not in the cache, in input order
+        """
+
+    @abstractmethod
+    def Items(self, kind: str) -> Iterator[tuple[str, dict]]:
+        """Iterate every cached object of a kind.
+
+        Parameters
+        ----------
+        kind : str
+            object kind, one of KINDS
+
+        Returns
+        -------
+        Iterator[tuple[str, dict]]
+            (spotify id, object) pairs
+        """
+
+    async def LoadItems(self, kind: str) -> list[tuple[str, dict]]:
+        """Read every cached object of a kind in a worker thread, off the event loop.
+
+        Parameters
+        ----------
+        kind : str
+            object kind, one of KINDS
+
+        Returns
+        -------
+        list[tuple[str, dict]]
+            (spotify id, object) pairs
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: list(self.Items(kind)))
+
+    @abstractmethod
+    def IsMigrated(self) -> bool:
+        """Has the legacy yaml cache already been imported."""
+
+    @abstractmethod
+    def SetMigrated(self) -> None:
+        """Record that the legacy yaml cache was imported."""
+
+    def Contains(self, kind: str, key: str) -> bool:
+        """Is the key cached."""
+        return self.Get(kind, key) is not None
+
+    def PutTracks(self, raw: dict[str, dict]) -> None:
+        """Slim and store track payloads, with their albums stored separately.
+
+        Parameters
+        ----------
+        raw : dict[str, dict]
+            track payloads keyed by spotify id
+        """
+        self.BumpIfCached("tracks", raw)
+        tracks = {key: SlimTrack(value) for key, value in raw.items()}
+        albums: dict[str, dict] = {}
+        refreshed = False
+        for track in tracks.values():
+            album = track["album"]
+            shared = albums.get(album["id"]) or self.Get("albums", album["id"])
+            if shared is None:
+                shared = album
+            elif len(album) > 1 and album != shared:
+                # upsert in place so tracks already loaded see the refreshed album,
+                # a bare album id keeps what is stored
+                refreshed = refreshed or album["id"] not in albums
+                shared.update(album)
+            albums[album["id"]] = track["album"] = shared
+        if refreshed:
+            self.Version += 1
+            self.SaveVersion()
+        self.Put("albums", albums)
+        self.Put("tracks", tracks)
+
+    def PutArtists(self, raw: dict[str, dict]) -> None:
+        """Slim and store artist payloads.
+
+        Parameters
+        ----------
+        raw : dict[str, dict]
+            artist payloads keyed by spotify id
+        """
+        self.BumpIfCached("artists", raw)
+        artists = {key: SlimArtist(value) for key, value in raw.items()}
+        self.Put("artists", artists)
+        for watcher in self.ArtistWatchers:
+            watcher(artists)
+
+    def BumpIfCached(self, kind: str, keys: Iterable[str]) -> None:
+        """Bump the version if any of the keys is already cached."""
+        keys = list(keys)
+        if keys and len(self.Missing(kind, keys)) < len(set(keys)):
+            self.Version += 1
+            self.SaveVersion()
+
+    def SaveVersion(self) -> None:
+        """Persist the version, if the backend is persistent."""
+
+    def Migrate(self, yamlFile: Path) -> None:
+        """Import the legacy yaml cache once.
+
+        Parameters
+        ----------
+        yamlFile : Path
+            path of the old cache.yml
+        """
+        if self.IsMigrated():
+            return
+        if yamlFile.exists():
+            print(f"Migrating {yamlFile} into metadata cache")
+            with yamlFile.open(encoding="utf-8", mode="r") as fp:
+                data = load(fp) or {}
+            self.PutTracks(
+                {str(k): v for k, v in (data.get("tracks") or {}).items() if isinstance(v, dict)},
+            )
+            self.PutArtists(
+                {str(k): v for k, v in (data.get("artists") or {}).items() if isinstance(v, dict)},
+            )
+        self.SetMigrated()
+
+
+class MemoryCache(CacheBackend):
+    """Non persistent cache held in dicts, used for testing and benchmarks."""
+
+    def __init__(self) -> None:
+        """Create an empty cache."""
+        super().__init__()
+        self.Data: dict[str, dict[str, dict]] = {kind: {} for kind in KINDS}
+        self.Migrated: bool = False
+
+    def Get(self, kind: str, key: str) -> dict | None:
+        """Get a single object."""
+        return self.Data[kind].get(key)
+
+    def Put(self, kind: str, items: dict[str, dict]) -> None:
+        """Insert or replace many objects at once."""
+        self.Data[kind].update(items)
+
+    def Missing(self, kind: str, keys: Iterable[str]) -> list[str]:
+        """Get which keys are not cached."""
+        return [x for x in keys if x not in self.Data[kind]]
+
+    def Items(self, kind: str) -> Iterator[tuple[str, dict]]:
+        """Iterate every cached object of a kind."""
+        yield from list(self.Data[kind].items())
+
+    def IsMigrated(self) -> bool:
+        """Has the legacy yaml cache already been imported."""
+        return self.Migrated
+
+    def SetMigrated(self) -> None:
+        """Record that the legacy yaml cache was imported."""
+        self.Migrated = True
+
+
+class SqliteCache(CacheBackend):
+    """Cache persisted to a local sqlite database, one table per kind.
+
+    Rows are decoded lazily on first access and kept in memory afterwards, so only
+    the objects actually used by a command are ever resident. Tracks are stored with
+    their album id and joined to the albums table when decoded. Writes made on the
+    event loop are committed together after CacheCommitDelay seconds, the connection
+    sees its own uncommitted rows meanwhile.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Open or create the database.
+
+        Parameters
+        ----------
+        path : Path
+            sqlite database file
+        """
+        super().__init__()
+        self.Connection = sqlite3.connect(path, check_same_thread=False)
+        self.CommitHandle: asyncio.TimerHandle | None = None
+        self.Connection.execute("PRAGMA journal_mode=WAL")
+        self.Connection.execute("PRAGMA synchronous=NORMAL")
+        self.Connection.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+        )
+        for kind in KINDS:
+            self.Connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {kind} (id TEXT PRIMARY KEY, data TEXT NOT NULL)",
+            )
+        self.Connection.commit()
+        self.Loaded: dict[str, dict[str, dict]] = {kind: {} for kind in KINDS}
+        row = self.Connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        self.Version = int(row[0]) if row is not None else 0
+        self.Upgrade()
+        atexit.register(self.Commit)
+
+    def SaveVersion(self) -> None:
+        """Persist the version so caches keyed on it survive restarts."""
+        self.Connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+            (str(self.Version),),
+        )
+        self.ScheduleCommit()
+
+    def ScheduleCommit(self) -> None:
+        """Commit soon, so a burst of puts shares one transaction."""
+        if self.CommitHandle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # in a worker thread, e.g. migrating, nothing else is waiting on it
+            self.Commit()
+            return
+        self.CommitHandle = loop.call_later(CONFIG.get("CacheCommitDelay", 1.0), self.Commit)
+
+    def Commit(self) -> None:
+        """Commit pending writes now."""
+        if self.CommitHandle is not None:
+            self.CommitHandle.cancel()
+            self.CommitHandle = None
+        self.Connection.commit()
+
+    def Encode(self, kind: str, value: dict) -> str:
+        """Serialise an object for storage."""
+        if kind == "tracks":
+            value = {**value, "album": value["album"]["id"]}
+        return json.dumps(value)
+
+    def Decode(self, kind: str, data: str) -> dict:
+        """Deserialise a stored object."""
+        value = json.loads(data)
+        if kind == "tracks":
+            value["album"] = self.Get("albums", value["album"]) or {"id": value["album"]}
+        return value
+
+    def Upgrade(self) -> None:
+        """Convert rows written with full spotify payloads to the slim schema."""
+        row = self.Connection.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is not None and row[0] == SCHEMA_VERSION:
+            return
+        rawAlbums = self.Connection.execute("SELECT id, data FROM albums").fetchall()
+        rawTracks = self.Connection.execute("SELECT id, data FROM tracks").fetchall()
+        rawArtists = self.Connection.execute("SELECT id, data FROM artists").fetchall()
+        if rawTracks or rawArtists:
+            print("Converting metadata cache to slim schema")
+            self.Put("albums", {key: SlimAlbum(json.loads(data)) for key, data in rawAlbums})
+            self.PutTracks({key: json.loads(data) for key, data in rawTracks})
+            self.PutArtists({key: json.loads(data) for key, data in rawArtists})
+            self.Loaded = {kind: {} for kind in KINDS}
+        self.Connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)",
+            (SCHEMA_VERSION,),
+        )
+        self.Connection.commit()
+        if rawTracks or rawArtists:
+            self.Connection.execute("VACUUM")
+
+    def Get(self, kind: str, key: str) -> dict | None:
+        """Get a single object."""
+        if key in self.Loaded[kind]:
+            return self.Loaded[kind][key]
+        row = self.Connection.execute(
+            f"SELECT data FROM {kind} WHERE id = ?",  # noqa: S608
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        self.Loaded[kind][key] = self.Decode(kind, row[0])
+        return self.Loaded[kind][key]
+
+    def Put(self, kind: str, items: dict[str, dict]) -> None:
+        """Insert or replace many objects at once."""
+        if not items:
+            return
+        self.Loaded[kind].update(items)
+        self.Connection.executemany(
+            f"INSERT OR REPLACE INTO {kind} (id, data) VALUES (?, ?)",  # noqa: S608
+            [(key, self.Encode(kind, value)) for key, value in items.items()],
+        )
+        self.ScheduleCommit()
+
+    def Missing(self, kind: str, keys: Iterable[str]) -> list[str]:
+        """Get which keys are not cached."""
+        unknown = [x for x in dict.fromkeys(keys) if x not in self.Loaded[kind]]
+        found: set[str] = set()
+        for chunk in chunked(unknown, 500):
+            placeholders = ",".join("?" * len(chunk))
+            found.update(
+                row[0]
+                for row in self.Connection.execute(
+                    f"SELECT id FROM {kind} WHERE id IN ({placeholders})",  # noqa: S608
+                    chunk,
+                )
+            )
+        return [x for x in unknown if x not in found]
+
+    def Items(self, kind: str) -> Iterator[tuple[str, dict]]:
+        """Iterate every cached object of a kind."""
+        rows = self.Connection.execute(f"SELECT id, data FROM {kind}").fetchall()  # noqa: S608
+        for key, data in rows:
+            yield key, self.Loaded[kind].get(key) or self.Decode(kind, data)
+
+    def IsMigrated(self) -> bool:
+        """Has the legacy yaml cache already been imported."""
+        return (
+            self.Connection.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+            is not None
+        )
+
+    def SetMigrated(self) -> None:
+        """Record that the legacy yaml cache was imported."""
+        self.Connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', '1')",
+        )
+        self.Connection.commit()
+
+
+CACHE_BACKENDS: dict[str, Callable[[], CacheBackend]] = {
+    "sqlite": lambda: SqliteCache(CACHE_DB_FILE),
+    "memory": MemoryCache,
+}
+METADATA_CACHE: CacheBackend | None = None
+
+
+async def GetCache() -> CacheBackend:
+    """Access the metadata cache, opens and migrates it if not done yet."""
+    global METADATA_CACHE
+    async with CACHE_LOCK:
+        if METADATA_CACHE is None:
+            backend = CACHE_BACKENDS[CONFIG.get("CacheBackend", "sqlite")]()
+            await asyncio.get_running_loop().run_in_executor(None, backend.Migrate, CACHE_FILE)
+            METADATA_CACHE = backend
+    return METADATA_CACHE
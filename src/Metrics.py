@@ -0,0 +1,199 @@
+"""In-process counters and latency histograms, shown by !metrics and optionally served
+to Prometheus.
+
+Nothing here imports the rest of the bot, so any module can record into METRICS.
+"""
+
+import asyncio
+import bisect
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+# upper bounds in seconds, prometheus style, the last bucket is everything above
+BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """Observation counts per bucket, with their count and sum."""
+
+    __slots__ = ("Counts", "Count", "Sum")
+
+    def __init__(self) -> None:
+        """Create an empty histogram."""
+        self.Counts: list[int] = [0] * (len(BUCKETS) + 1)
+        self.Count: int = 0
+        self.Sum: float = 0.0
+
+    def Observe(self, value: float) -> None:
+        """Add an observation."""
+        self.Counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.Count += 1
+        self.Sum += value
+
+    def Quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        rank = q * self.Count
+        seen = 0
+        for bound, count in zip((*BUCKETS, float("inf")), self.Counts, strict=True):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricRegistry:
+    """Named counters and histograms, each split by labels."""
+
+    def __init__(self) -> None:
+        """Create an empty registry."""
+        self.Counters: defaultdict[str, defaultdict[Labels, float]] = defaultdict(
+            lambda: defaultdict(float),
+        )
+        self.Histograms: defaultdict[str, defaultdict[Labels, Histogram]] = defaultdict(
+            lambda: defaultdict(Histogram),
+        )
+        self.Started: float = time.time()
+
+    def Count(self, name: str, value: float = 1.0, **labels: str) -> None:
+        """Increase a counter.
+
+        Parameters
+        ----------
+        name : str
+            metric name
+        value : float, optional
+            amount to add, by default 1.0
+        labels : str
+            label values, e.g. endpoint="tracks"
+        """
+        self.Counters[name][tuple(sorted(labels.items()))] += value
+
+    def Observe(self, name: str, value: float, **labels: str) -> None:
+        """Add an observation to a histogram, in seconds for timings."""
+        self.Histograms[name][tuple(sorted(labels.items()))].Observe(value)
+
+    @contextmanager
+    def Time(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe how long the block takes, awaits included, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.Observe(name, time.perf_counter() - start, **labels)
+
+    def Reset(self) -> None:
+        """Forget everything recorded."""
+        self.Counters.clear()
+        self.Histograms.clear()
+        self.Started = time.time()
+
+    def Summary(self) -> str:
+        """Human readable digest of every metric, for !metrics.
+
+        Returns
+        -------
+        str
+            one line per metric and label set
+        """
+        lines = [f"Metrics over the last {(time.time() - self.Started) / 3600:.1f}h"]
+        for name, series in sorted(self.Histograms.items()):
+            lines.append(f"{name}:")
+            for labels, histogram in sorted(series.items(), key=lambda x: -x[1].Sum):
+                lines.append(
+                    f"  {FormatLabels(labels) or '-'}: n={histogram.Count}"
+                    f" mean={histogram.Sum / max(histogram.Count, 1) * 1000:.1f}ms"
+                    f" p50<={histogram.Quantile(0.5) * 1000:g}ms"
+                    f" p95<={histogram.Quantile(0.95) * 1000:g}ms",
+                )
+        for name, series in sorted(self.Counters.items()):
+            lines.append(f"{name}:")
+            for labels, value in sorted(series.items(), key=lambda x: -x[1]):
+                lines.append(f"  {FormatLabels(labels) or '-'}: {value:g}")
+        return "\n".join(lines)
+
+    def Prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, series in sorted(self.Counters.items()):
+            lines.append(f"# TYPE spoticord_{name} counter")
+            lines.extend(
+                f"spoticord_{name}{PromLabels(labels)} {value:g}"
+                for labels, value in series.items()
+            )
+        for name, series in sorted(self.Histograms.items()):
+            lines.append(f"# TYPE spoticord_{name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, float("inf")), histogram.Counts, strict=True):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    bucketLabels = PromLabels((*labels, ("le", le)))
+                    lines.append(f"spoticord_{name}_bucket{bucketLabels} {cumulative}")
+                lines.append(f"spoticord_{name}_sum{PromLabels(labels)} {histogram.Sum:g}")
+                lines.append(f"spoticord_{name}_count{PromLabels(labels)} {histogram.Count}")
+        return "\n".join(lines) + "\n"
+
+
+def FormatLabels(labels: Labels) -> str:
+    """Labels as key=value pairs."""
+    return " ".join(f"{k}={v}" for k, v in labels)
+
+
+def PromLabels(labels: Labels) -> str:
+    """Labels in Prometheus syntax, empty if there are none."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{EscapeLabel(v)}"' for k, v in labels) + "}"
+
+
+def EscapeLabel(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS: MetricRegistry = MetricRegistry()
+METRICS_SERVER: asyncio.Server | None = None
+
+
+async def ServeMetrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer one http request with the Prometheus text, whatever the path."""
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5.0)
+        body = METRICS.Prometheus().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body,
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def StartMetricsServer(port: int | None, host: str = "127.0.0.1") -> None:
+    """Serve Prometheus text on host:port, if a port is configured and not serving yet."""
+    global METRICS_SERVER
+    if port is None or METRICS_SERVER is not None:
+        return
+    METRICS_SERVER = await asyncio.start_server(ServeMetrics, host, port)
+    print(f"Serving metrics on http://{host}:{port}/metrics")
@@ -0,0 +1,101 @@
+"""Tracks sorted by release date, for range queries with bisect."""
+
+import asyncio
+import bisect
+from collections.abc import Iterable
+from datetime import date
+
+from MetadataCache import GetCache
+from SpotifyAccess import GetFullInfoBatch
+
+
+class ReleaseIndex:
+    """Track ids ordered by their album's release date.
+
+    Tracks are added as callers ask about them, so ranges only cover tracks that have
+    been resolved. Known holds every track looked up, dated or not, so none is fetched
+    twice.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty index."""
+        self.Ordinals: list[int] = []
+        self.TrackIds: list[str] = []
+        self.Known: set[str] = set()
+        self.MetaVersion: int | None = None
+
+    def Add(self, items: list[tuple[int, str]]) -> None:
+        """Insert (release ordinal, track id) pairs, keeping the index sorted."""
+        if len(items) > len(self.Ordinals):
+            merged = sorted([*zip(self.Ordinals, self.TrackIds, strict=True), *items])
+            self.Ordinals = [x[0] for x in merged]
+            self.TrackIds = [x[1] for x in merged]
+            return
+        for ordinal, trackId in items:
+            pos = bisect.bisect_right(self.Ordinals, ordinal)
+            self.Ordinals.insert(pos, ordinal)
+            self.TrackIds.insert(pos, trackId)
+
+    def Between(self, start: date | None, end: date | None) -> set[str]:
+        """Track ids released within a date range.
+
+        Parameters
+        ----------
+        start : date | None
+            first release day included, open if None
+        end : date | None
+            last release day included, open if None
+
+        Returns
+        -------
+        set[str]
+            matching track ids
+        """
+        low = 0 if start is None else bisect.bisect_left(self.Ordinals, start.toordinal())
+        high = (
+            len(self.Ordinals)
+            if end is None
+            else bisect.bisect_right(self.Ordinals, end.toordinal())
+        )
+        return set(self.TrackIds[low:high])
+
+    def Reset(self, metaVersion: int) -> None:
+        """Forget every track after cached metadata was overwritten."""
+        self.Ordinals.clear()
+        self.TrackIds.clear()
+        self.Known.clear()
+        self.MetaVersion = metaVersion
+
+
+RELEASE_INDEX: ReleaseIndex = ReleaseIndex()
+RELEASE_INDEX_LOCK: asyncio.Lock = asyncio.Lock()
+
+
+async def GetReleaseIndex(trackIds: Iterable[str] = ()) -> ReleaseIndex:
+    """Access the release index, adding any of the given tracks not looked up yet.
+
+    Parameters
+    ----------
+    trackIds : Iterable[str], optional
+        tracks to date, by default none
+
+    Returns
+    -------
+    ReleaseIndex
+        the release index
+    """
+    async with RELEASE_INDEX_LOCK:
+        cache = await GetCache()
+        if RELEASE_INDEX.MetaVersion != cache.Version:
+            RELEASE_INDEX.Reset(cache.Version)
+        pending = {str(x) for x in trackIds} - RELEASE_INDEX.Known
+        if pending:
+            await GetFullInfoBatch(pending)
+        items: list[tuple[int, str]] = []
+        for trackId in pending:
+            track = cache.Get("tracks", trackId)
+            if track and (ordinal := track["album"].get("release_ordinal")) is not None:
+                items.append((ordinal, trackId))
+        RELEASE_INDEX.Add(items)
+        RELEASE_INDEX.Known |= pending
+    return RELEASE_INDEX
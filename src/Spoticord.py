@@ -1,9 +1,11 @@
 """Main of Spoticord Bot."""
 
+import asyncio
 import datetime as dt
 import math
 import random
 import re
+import weakref
 
 from discord import Message
 from discord.ext import tasks
@@ -11,9 +13,24 @@ from discord.ext import tasks
 from Commands import HandleCommands
 from DataLogging import GetResponse, LogUserData
 from Defines import COMMAND_KEY, CONFIG, DISCORD_CLIENT, GetMemory, SaveMemory, Status
+from Graphing import WarmRenderPool
+from Metrics import METRICS, StartMetricsServer
 from SpotifyAccess import AddToPlaylist, ForceTrack
 from Utility import DadMode, NotifyPlaylistLength, NotifyUserLength, SendMessage, TimeToSec
 
+# held from the repeat check until the submission is logged, so two posts of one track
+# cannot both be added, dropped once nobody holds them
+SUBMISSION_LOCKS: weakref.WeakValueDictionary[tuple[str, str], asyncio.Lock] = (
+    weakref.WeakValueDictionary()
+)
+
+
+def SubmissionLock(playlistID: str, trackID: str) -> asyncio.Lock:
+    """Get the lock serialising submissions of a track to a playlist."""
+    if (lock := SUBMISSION_LOCKS.get((playlistID, trackID))) is None:
+        lock = SUBMISSION_LOCKS[(playlistID, trackID)] = asyncio.Lock()
+    return lock
+
 
 @tasks.loop(seconds=300)
 async def Poke() -> None:
@@ -80,6 +97,11 @@ async def ReAnnounce() -> None:
         await SendMessage("I'm back 😎", channel, useChannel=True)
     else:
         print("Can't find channel for announce")
+    WarmRenderPool()
+    try:
+        await StartMetricsServer(CONFIG.get("MetricsPort"))
+    except OSError as e:
+        print(f"Could not serve metrics: {e!r}")
     Poke.start()  # pyright: ignore[reportFunctionMemberAccess]
     SpecialTimes.start()  # pyright: ignore[reportFunctionMemberAccess]
 
@@ -98,29 +120,38 @@ async def MessageHandler(message: Message) -> None:
     logged: bool = False
 
     if username != "Spoticord":
-        await DadMode(message)
+        with METRICS.Time("handler_phase_seconds", phase="DadMode"):
+            await DadMode(message)
     else:
         return
 
-    if message.content and message.content[0] == COMMAND_KEY and (await HandleCommands(message)):
-        return
+    if message.content and message.content[0] == COMMAND_KEY:
+        with METRICS.Time("handler_phase_seconds", phase="dispatch"):
+            handled = await HandleCommands(message)
+        if handled:
+            return
 
     if playlistID := CONFIG["Channel Maps"].get(message.channel.name, None):
         for trackID in re.findall(CONFIG["Regex"]["track"], message.content):
-            status, trackInfo = (
-                await ForceTrack(trackID, playlistID)
-                if "!force" in message.content[:7]
-                else await AddToPlaylist(trackID, playlistID, isTesting)
-            )
-            if status == Status.Repeat:
-                username = trackInfo[-1]
-            if response := GetResponse(status, username, isTesting):
-                await SendMessage(response, message, reply=True)
-
-            await LogUserData(trackInfo, username, status, playlistID, isTesting)
+            async with SubmissionLock(playlistID, trackID):
+                with METRICS.Time("handler_phase_seconds", phase="AddToPlaylist"):
+                    status, trackInfo = (
+                        await ForceTrack(trackID, playlistID)
+                        if "!force" in message.content[:7]
+                        else await AddToPlaylist(trackID, playlistID, isTesting)
+                    )
+                METRICS.Count("submissions_total", status=str(status))
+                if status == Status.Repeat:
+                    username = trackInfo[-1]
+                if response := GetResponse(status, username, isTesting):
+                    await SendMessage(response, message, reply=True)
+
+                with METRICS.Time("handler_phase_seconds", phase="LogUserData"):
+                    await LogUserData(trackInfo, username, status, playlistID, isTesting)
             if status.WasSuccessful:
-                await NotifyPlaylistLength(message)
-                await NotifyUserLength(message)
+                with METRICS.Time("handler_phase_seconds", phase="notifications"):
+                    await NotifyPlaylistLength(message)
+                    await NotifyUserLength(message)
             logged = True
 
         if not logged and "open.spotify" in message.content:
@@ -1,14 +1,22 @@
 """Handle all spotify api calls."""
 
+import asyncio
 import random
 import re
+from collections.abc import Iterable
 
 import spotipy
+from more_itertools import chunked
 
-from Defines import CONFIG, SPOTIFY_CLIENT, GetMemory, GetUserData, SaveMemory, Status
+from Defines import CONFIG, SPOTIFY, GetMemory, GetUserDataStore, SaveMemory, Status
+from MetadataCache import GetCache
+from Metrics import METRICS
 
+BATCH_SIZE: int = 50
+TRACK_ID: str = r"[0-9a-zA-Z]{22}"
 
-def GetAllTracks(playlistId: str) -> list[dict]:
+
+async def GetAllTracks(playlistId: str) -> list[dict]:
     """Get all current tracks in playlist.
 
     Parameters
@@ -22,10 +30,10 @@ def GetAllTracks(playlistId: str) -> list[dict]:
         list of track data
     """
     # todo incorporate cache or cut
-    results = SPOTIFY_CLIENT.playlist_tracks(playlistId)
+    results = await SPOTIFY.playlist_tracks(playlistId)
     tracks = results["items"]
     while results["next"]:
-        results = SPOTIFY_CLIENT.next(results)
+        results = await SPOTIFY.next(results)
         tracks.extend(results["items"])
     return tracks
 
@@ -38,10 +46,10 @@ async def CreateUserPlaylist(user: str, commandDesc: str, tracks: list[str]) ->
     playlistId = memory["UserPlaylists"].get(user, "None")
     tracks = tracks[:100] if len(tracks) > 100 else tracks
     if playlistId != "None":
-        SPOTIFY_CLIENT.playlist_replace_items(playlistId, tracks)
-        SPOTIFY_CLIENT.playlist_change_details(playlistId, description=commandDesc)
+        await SPOTIFY.playlist_replace_items(playlistId, tracks)
+        await SPOTIFY.playlist_change_details(playlistId, description=commandDesc)
     else:
-        response = SPOTIFY_CLIENT.user_playlist_create(
+        response = await SPOTIFY.user_playlist_create(
             user="atomicbrit",
             name=f"{user}'s Spoticord Selection",
             description=commandDesc,
@@ -49,7 +57,7 @@ async def CreateUserPlaylist(user: str, commandDesc: str, tracks: list[str]) ->
         playlistId = response["id"]
         memory["UserPlaylists"][user] = playlistId
         await SaveMemory()
-        SPOTIFY_CLIENT.playlist_add_items(playlistId, tracks)
+        await SPOTIFY.playlist_add_items(playlistId, tracks)
     return playlistId
 
 
@@ -66,11 +74,7 @@ async def IsARepeat(trackId: str, playlistID: str) -> tuple[bool, str]:
     bool
         true if is a repeat
     """
-    matches = [
-        x
-        for x in await GetUserData()
-        if playlistID == x.PlaylistID and x.TrackId == trackId and x.EntryStatus.WasSuccessful
-    ]
+    matches = (await GetUserDataStore()).Successes(trackId, playlistID)
     return (len(matches) > 0), "" if len(matches) == 0 else matches[0].User
 
 
@@ -125,7 +129,7 @@ async def AddToPlaylist(trackId: str, playlistId: str, isTesting: bool) -> tuple
         result = Status.BadVibes
 
     if result == Status.Default:
-        if exception := AddTrack(trackId, playlistId, isTesting):
+        if exception := await AddTrack(trackId, playlistId, isTesting):
             print(exception)
             result = Status.Failed
         else:
@@ -133,14 +137,14 @@ async def AddToPlaylist(trackId: str, playlistId: str, isTesting: bool) -> tuple
     return (result, (trackId, title, artist, uri, extra))
 
 
-def AddTrack(
+async def AddTrack(
     trackId: str,
     playlistId: str,
     isTesting: bool,
 ) -> spotipy.exceptions.SpotifyException | None:
     try:
         if not isTesting:
-            SPOTIFY_CLIENT.playlist_add_items(playlistId, [trackId])
+            await SPOTIFY.playlist_add_items(playlistId, [trackId])
     except spotipy.exceptions.SpotifyException as e:
         return e
 
@@ -148,7 +152,7 @@ def AddTrack(
 async def ForceTrack(trackId: str, playlistId: str) -> tuple[Status, tuple]:
     _addChance, title, artist, uri, _regions = await GetDetails(trackId)
 
-    if _exception := AddTrack(trackId, playlistId, False):
+    if _exception := await AddTrack(trackId, playlistId, False):
         title = "ERROR"
         artist = "ERROR"
 
@@ -171,48 +175,138 @@ async def GetDetails(trackId: str) -> tuple:
 
 
 async def GetFullInfo(trackId: str) -> dict[str, dict]:
-    memory: dict[str, dict] = await GetMemory()
-    updatedMemory: bool = False
+    cache = await GetCache()
     trackInfo: dict = {}
     artistInfo: dict = {}
-    if trackId in memory["Cache"]["tracks"]:
-        trackInfo = memory["Cache"]["tracks"][trackId]
+    if cached := cache.Get("tracks", trackId):
+        METRICS.Count("cache_lookups_total", kind="tracks", result="hit")
+        trackInfo = cached
     elif re.match(r"[0-9a-zA-Z]+", trackId.strip()):
+        METRICS.Count("cache_lookups_total", kind="tracks", result="miss")
         try:
-            trackInfo = SPOTIFY_CLIENT.track(trackId)
-            trackInfo.pop("available_markets")
-            trackInfo["album"].pop("available_markets")
-            memory["Cache"]["tracks"][trackId] = trackInfo
-            updatedMemory = True
+            print(f"Caching {trackId}")
+            cache.PutTracks({trackId: await SPOTIFY.track(trackId)})
+            trackInfo = cache.Get("tracks", trackId) or {}
         except spotipy.exceptions.SpotifyException:
             return {"track": {}, "artist": {}}
 
     artistId = str(trackInfo["artists"][0]["id"])
-    if artistId in memory["Cache"]["artists"]:
-        artistInfo = memory["Cache"]["artists"][artistId]
-    else:
-        artistInfo = SPOTIFY_CLIENT.artist(artistId)
-        memory["Cache"]["artists"][artistId] = artistInfo
-        updatedMemory = True
-
-    if updatedMemory:
-        print(f"Saving Memory on {trackId}")
-        await SaveMemory()
+    artistInfo = (await GetArtistInfo(artistId))["artist"]
     return {"track": trackInfo, "artist": artistInfo}
 
 
 async def GetArtistInfo(artistId: str) -> dict[str, dict]:
-    memory: dict[str, dict] = await GetMemory()
-    updatedMemory: bool = False
+    cache = await GetCache()
     artistInfo: dict = {}
 
-    if artistId in memory["Cache"]["artists"]:
-        artistInfo = memory["Cache"]["artists"][artistId]
+    if cached := cache.Get("artists", artistId):
+        METRICS.Count("cache_lookups_total", kind="artists", result="hit")
+        artistInfo = cached
     else:
-        artistInfo = SPOTIFY_CLIENT.artist(artistId)
-        memory["Cache"]["artists"][artistId] = artistInfo
-        updatedMemory = True
-
-    if updatedMemory:
-        await SaveMemory()
+        METRICS.Count("cache_lookups_total", kind="artists", result="miss")
+        cache.PutArtists({artistId: await SPOTIFY.artist(artistId)})
+        artistInfo = cache.Get("artists", artistId) or {}
     return {"artist": artistInfo}
+
+
+async def FetchBatched(endpoint: str, key: str, ids: list[str]) -> dict[str, dict]:
+    """Fetch many objects from a multi-id endpoint in chunks of BATCH_SIZE.
+
+    Parameters
+    ----------
+    endpoint : str
+        spotipy method name, e.g. tracks or artists
+    key : str
+        key of the object list in the response
+    ids : list[str]
+        unique ids to fetch
+
+    Returns
+    -------
+    dict[str, dict]
+        fetched objects keyed by the requested id, missing ids are left out
+    """
+    chunks = [list(x) for x in chunked(ids, BATCH_SIZE)]
+    responses = await asyncio.gather(
+        *(getattr(SPOTIFY, endpoint)(chunk) for chunk in chunks),
+        return_exceptions=True,
+    )
+    out: dict[str, dict] = {}
+    for chunk, response in zip(chunks, responses, strict=True):
+        if isinstance(response, spotipy.exceptions.SpotifyException):
+            print(f"Failed batch {endpoint} request: {response}")
+            # retrying one by one would only be throttled again
+            if response.http_status != 429:
+                out.update(await FetchSingly(endpoint.removesuffix("s"), chunk))
+            continue
+        if isinstance(response, BaseException):
+            raise response
+        out.update({x: info for x, info in zip(chunk, response[key], strict=False) if info})
+    return out
+
+
+async def FetchSingly(endpoint: str, ids: list[str]) -> dict[str, dict]:
+    """Fetch objects one request per id, leaving out the ones that fail.
+
+    Parameters
+    ----------
+    endpoint : str
+        spotipy single id method name, e.g. track or artist
+    ids : list[str]
+        unique ids to fetch
+
+    Returns
+    -------
+    dict[str, dict]
+        fetched objects keyed by id
+    """
+    responses = await asyncio.gather(
+        *(getattr(SPOTIFY, endpoint)(x) for x in ids),
+        return_exceptions=True,
+    )
+    out: dict[str, dict] = {}
+    for x, response in zip(ids, responses, strict=True):
+        if isinstance(response, spotipy.exceptions.SpotifyException):
+            print(f"Failed {endpoint} request for {x}: {response}")
+            continue
+        if isinstance(response, BaseException):
+            raise response
+        if response:
+            out[x] = response
+    return out
+
+
+async def GetFullInfoBatch(trackIds: Iterable[str]) -> dict[str, dict[str, dict]]:
+    """Get full info for many tracks, filling cache misses with batched requests.
+
+    Parameters
+    ----------
+    trackIds : Iterable[str]
+        unique track ids, duplicates are ignored
+
+    Returns
+    -------
+    dict[str, dict[str, dict]]
+        track and artist info keyed by track id, for every track that could be found
+    """
+    cache = await GetCache()
+    trackIds = list(dict.fromkeys(str(x) for x in trackIds))
+
+    # a malformed id would fail the whole chunk it is sent in
+    missingTracks = [x for x in cache.Missing("tracks", trackIds) if re.fullmatch(TRACK_ID, x)]
+    # batch fetched misses then count as hits in GetFullInfo below
+    METRICS.Count("cache_lookups_total", len(missingTracks), kind="tracks", result="prefetch")
+    fetchedTracks = await FetchBatched("tracks", "tracks", missingTracks)
+    cache.PutTracks(fetchedTracks)
+
+    tracks = {x: info for x in trackIds if (info := cache.Get("tracks", x))}
+    missingArtists = cache.Missing(
+        "artists",
+        (str(x["artists"][0]["id"]) for x in tracks.values() if x.get("artists")),
+    )
+    METRICS.Count("cache_lookups_total", len(missingArtists), kind="artists", result="prefetch")
+    cache.PutArtists(await FetchBatched("artists", "artists", missingArtists))
+
+    if fetchedTracks:
+        print(f"Cached batch of {len(fetchedTracks)} tracks")
+    return {x: await GetFullInfo(x) for x in tracks}
@@ -0,0 +1,201 @@
+"""Record spotify client responses to disk and replay them offline.
+
+A fixture store is a directory holding one json lines file per client method. Each
+line is a call with its arguments, response or error, and how long it took. Track
+and artist objects are also indexed by id, so replayed batch requests can be answered
+however the ids were chunked when recording.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any
+
+import spotipy
+
+# batch endpoints whose objects are indexed by id: method -> (response key, single id method)
+BATCHED: dict[str, tuple[str, str]] = {
+    "tracks": ("tracks", "track"),
+    "artists": ("artists", "artist"),
+}
+SINGLE: set[str] = {x[1] for x in BATCHED.values()}
+
+
+def CallKey(method: str, args: tuple, kwargs: dict) -> str:
+    """Stable key of a client call, a page is keyed by its next url."""
+    args = tuple(x["next"] if isinstance(x, dict) and "next" in x else x for x in args)
+    return json.dumps([method, args, kwargs], sort_keys=True, default=str)
+
+
+class FixtureStore:
+    """Recorded calls by key and recorded objects by id."""
+
+    def __init__(self, directory: Path) -> None:
+        """Load any fixtures already in directory.
+
+        Parameters
+        ----------
+        directory : Path
+            fixture directory, created on the first recorded call
+        """
+        self.Directory = directory
+        self.Calls: dict[str, dict] = {}
+        self.Objects: defaultdict[str, dict[str, dict]] = defaultdict(dict)
+        self.Lock = threading.Lock()
+        for path in sorted(directory.glob("*.jsonl")):
+            with path.open(encoding="utf-8") as fp:
+                for line in fp:
+                    if line.strip():
+                        self.Index(json.loads(line))
+
+    def Index(self, record: dict) -> None:
+        """Make a recorded call available for replay."""
+        self.Calls[record["key"]] = record
+        response = record.get("response")
+        if record["method"] in BATCHED and response:
+            key, single = BATCHED[record["method"]]
+            self.Objects[single].update({x["id"]: x for x in response[key] if x})
+        elif record["method"] in SINGLE and response:
+            self.Objects[record["method"]][response["id"]] = response
+
+    def Save(self, record: dict) -> None:
+        """Append a call to its method's file and index it."""
+        with self.Lock:
+            self.Directory.mkdir(parents=True, exist_ok=True)
+            path = self.Directory / f"{record['method']}.jsonl"
+            with path.open(mode="a", encoding="utf-8") as fp:
+                fp.write(json.dumps(record, default=str) + "\n")
+            self.Index(record)
+
+
+class RecordingSpotify:
+    """Pass every call through to a real client and save the outcome to a FixtureStore.
+
+    Errors are recorded with their status and headers, so rate limiting that outlasts
+    spotipy's own retries replays as the same SpotifyException.
+    """
+
+    def __init__(self, client: spotipy.Spotify, store: FixtureStore) -> None:
+        """Wrap a client.
+
+        Parameters
+        ----------
+        client : spotipy.Spotify
+            real client
+        store : FixtureStore
+            where calls are saved
+        """
+        self.Client = client
+        self.Store = store
+
+    def __getattr__(self, name: str) -> Any:
+        """Get a recording version of a client method."""
+        method = getattr(self.Client, name)
+
+        def Call(*args: Any, **kwargs: Any) -> Any:
+            record: dict[str, Any] = {"method": name, "key": CallKey(name, args, kwargs)}
+            start = time.perf_counter()
+            try:
+                record["response"] = method(*args, **kwargs)
+            except spotipy.exceptions.SpotifyException as e:
+                record["error"] = {
+                    "http_status": e.http_status,
+                    "code": e.code,
+                    "msg": e.msg,
+                    "headers": dict(e.headers or {}),
+                }
+                raise
+            finally:
+                # connection errors never reached spotify, they are not worth replaying
+                if "response" in record or "error" in record:
+                    record["elapsed"] = time.perf_counter() - start
+                    self.Store.Save(record)
+            return record["response"]
+
+        return Call
+
+
+class ReplaySpotify:
+    """Serve recorded responses in place of a spotify client, with latency and throttling.
+
+    Calls block for their recorded duration, or a fixed latency if given. Beyond the
+    throttle rate, calls fail with a 429 like the real api. Unrecorded batch ids come
+    back as null like unknown ids do, other unrecorded calls raise a 404.
+    """
+
+    def __init__(
+        self,
+        store: FixtureStore,
+        latency: float | None = None,
+        throttle: float | None = None,
+    ) -> None:
+        """Create a replaying client.
+
+        Parameters
+        ----------
+        store : FixtureStore
+            recorded calls
+        latency : float | None, optional
+            seconds every call takes, by default the recorded duration
+        throttle : float | None, optional
+            calls per second allowed over a rolling second, by default unlimited
+        """
+        self.Store = store
+        self.Latency = latency
+        self.Throttle = throttle
+        self.Recent: deque[float] = deque()
+        self.Lock = threading.Lock()
+        self.Calls: defaultdict[str, int] = defaultdict(int)
+        self.Throttled: int = 0
+        self.Missed: int = 0
+
+    def __getattr__(self, name: str) -> Any:
+        """Get a replaying version of a client method."""
+
+        def Call(*args: Any, **kwargs: Any) -> Any:
+            self.Admit(name)
+            record = self.Store.Calls.get(CallKey(name, args, kwargs))
+            if self.Latency is not None:
+                time.sleep(self.Latency)
+            else:
+                time.sleep((record or {}).get("elapsed", 0.0))
+            if record is not None and "error" in record:
+                raise spotipy.exceptions.SpotifyException(**record["error"])
+            if record is not None:
+                return record["response"]
+            return self.Assemble(name, args)
+
+        return Call
+
+    def Admit(self, name: str) -> None:
+        """Count a call and fail it with a 429 if over the throttle rate."""
+        with self.Lock:
+            self.Calls[name] += 1
+            if self.Throttle is None:
+                return
+            now = time.monotonic()
+            while self.Recent and now - self.Recent[0] > 1.0:
+                self.Recent.popleft()
+            if len(self.Recent) >= self.Throttle:
+                self.Throttled += 1
+                raise spotipy.exceptions.SpotifyException(
+                    429,
+                    -1,
+                    "API rate limit exceeded",
+                    headers={"Retry-After": "1"},
+                )
+            self.Recent.append(now)
+
+    def Assemble(self, name: str, args: tuple) -> Any:
+        """Answer an unrecorded call from objects recorded by id."""
+        if name in BATCHED:
+            key, single = BATCHED[name]
+            found = [self.Store.Objects[single].get(x) for x in args[0]]
+            self.Missed += found.count(None)
+            return {key: found}
+        if name in SINGLE and args[0] in self.Store.Objects[name]:
+            return self.Store.Objects[name][args[0]]
+        self.Missed += 1
+        raise spotipy.exceptions.SpotifyException(404, -1, f"No fixture for {name}{args}")
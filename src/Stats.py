@@ -1,74 +1,193 @@
 """Functions to get stats."""
 
+import calendar
+import heapq
 import math
 import re
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from datetime import date
 from statistics import quantiles
 from typing import Any
 
 import pandas as pd
 from discord import Message
 
-from Defines import CONFIG, GetMemory, GetUserData, Status, UserDataEntry
+from Aggregates import GetAggregates
+from Defines import CONFIG, GetUserDataStore, Status, TimeWindow, UserDataEntry
+from GenreIndex import GetGenreIndex
 from Graphing import PrepDataFrame, PrepUserData
-from SpotifyAccess import GetFullInfo
-from Utility import SendMessage
+from MetadataCache import GetCache, ParseReleaseDate
+from ReleaseIndex import GetReleaseIndex
+from SpotifyAccess import GetFullInfo, GetFullInfoBatch
+from Utility import ParseTimeWindow, SendMessage
 
 STAT_COUNT: int = 10
 
-FILTERS: list = ["user:", "artist:", "genre:", r"T\d+", "reverse"]
+FILTERS: list = [
+    "user:",
+    "artist:",
+    "genre:",
+    "year:",
+    "decade:",
+    "released:",
+    "since:",
+    "until:",
+    "last:",
+    r"T\d+",
+    "reverse",
+]
+
+DateRange = tuple[date | None, date | None]
+
+
+class FilterError(ValueError):
+    """A filter in a command could not be parsed, the message says which."""
+
+
+@dataclass
+class FilterPlan:
+    """Filters parsed from a command.
+
+    Checks on the entry itself are compiled straight away. Genre and release filters
+    need metadata, so they are resolved afterwards and only for the entries the checks
+    keep.
+    """
+
+    StatCount: int = STAT_COUNT
+    Reverse: bool = True
+    Genre: str | None = None
+    Released: list[DateRange] = field(default_factory=list)
+    EntryChecks: list[Callable[[UserDataEntry], bool]] = field(default_factory=list)
+
+    def Matches(self, entry: UserDataEntry) -> bool:
+        """Check all filters, in the order they were added."""
+        return all(check(entry) for check in self.EntryChecks)
+
+
+def ParseReleaseBound(text: str, end: bool) -> date | None:
+    """Parse one side of a release range given as a year, month or day.
+
+    Parameters
+    ----------
+    text : str
+        bound such as 1990, 1990-06 or 1990-06-15, empty for an open range
+    end : bool
+        take the last day of the period instead of the first
+
+    Returns
+    -------
+    date | None
+        bound day, None if open
+
+    Raises
+    ------
+    FilterError
+        text is not empty and not a valid date
+    """
+    if not text:
+        return None
+    start = ParseReleaseDate(text)
+    if start is None or not re.fullmatch(r"\d{4}(-\d{1,2}){0,2}", text):
+        raise FilterError(f"`{text}` is not a release date, use e.g. 1999, 1999-05 or 1999-05-17")
+    if not end:
+        return start
+    match text.count("-"):
+        case 0:
+            return date(start.year, 12, 31)
+        case 1:
+            return date(start.year, start.month, calendar.monthrange(start.year, start.month)[1])
+        case _:
+            return start
+
+
+def CompileFilters(content: str) -> FilterPlan:
+    """Parse the filters in a command once.
+
+    Parameters
+    ----------
+    content : str
+        command text
+
+    Returns
+    -------
+    FilterPlan
+        compiled filters
+
+    Raises
+    ------
+    FilterError
+        a released: bound is not a date
+    """
+    plan = FilterPlan(Reverse="reverse" not in content)
+    if countMatch := re.search(r"\s[Tt](\d+)", content):
+        plan.StatCount = int(countMatch.group(1))
+    if userMatch := re.search(r"\suser:([^ ]+)", content):
+        username = userMatch.group(1)
+        plan.EntryChecks.append(lambda entry: entry.User == username)
+    if artistMatch := re.search(r"\sartist:\"?([^\"]+)\"?", content):
+        artist = artistMatch.group(1)
+        plan.EntryChecks.append(lambda entry: entry.Artist == artist)
+    if yearMatch := re.search(r"\syear:(\d{4})\b", content):
+        year = yearMatch.group(1)
+        plan.Released.append((ParseReleaseBound(year, False), ParseReleaseBound(year, True)))
+    if decadeMatch := re.search(r"\sdecade:(\d{2}|\d{4})s?\b", content):
+        decade = int(decadeMatch.group(1))
+        if decade < 100:
+            decade += 1900 if decade >= 30 else 2000
+        decade -= decade % 10
+        plan.Released.append((date(decade, 1, 1), date(decade + 9, 12, 31)))
+    if releasedMatch := re.search(r"\sreleased:([\d-]*)(\.\.)?([\d-]*)", content):
+        first, isRange, last = releasedMatch.groups()
+        if not first and not last:
+            raise FilterError("released: needs a date or a range such as 1990..1999-06")
+        last = last if isRange else first
+        plan.Released.append((ParseReleaseBound(first, False), ParseReleaseBound(last, True)))
+    # quote genres with spaces, an unquoted genre ends at the next space
+    if genreMatch := re.search(r"\sgenre:(?:\"([^\"]+)\"|(\S+))", content):
+        plan.Genre = genreMatch.group(1) or genreMatch.group(2)
+    return plan
 
 
 async def FilterData(message: Message, results: dict) -> dict:
     """Perform common filtering of data."""
     out: dict = results["Data"]
-    statCount: int = STAT_COUNT
-    if countMatch := re.search(r"\s[Tt](\d+)", message.content):
-        statCount = int(countMatch.group(1))
-    if yearMatch := re.search(r"\syear:(\d+)", message.content):
-        year = int(yearMatch.group(1))
-        trimmed: dict[UserDataEntry, Any] = out.copy()
-        for entry in out:
-            info = await GetFullInfo(entry.TrackId)
-            releaseDate = info["track"]["album"]["release_date"]
-            if str(year) not in releaseDate:
-                del trimmed[entry]
-        out = trimmed        
-    if userMatch := re.search(r"\suser:([^ ]+)", message.content):
-        username = userMatch.group(1)
-        out = {entry: value for entry, value in out.items() if entry.User == username}
-    if artistMatch := re.search(r"\sartist:\"?([^\"]+)\"?", message.content):
-        username = artistMatch.group(1)
-        out = {entry: value for entry, value in out.items() if entry.Artist == username}
-    if genreMatch := re.search(r"\sgenre:\"?([^\"]+)\"?", message.content):
-        genre = genreMatch.group(1)
-        trimmed: dict[UserDataEntry, Any] = out.copy()
-        for entry in out:
-            info: dict = await GetFullInfo(entry.TrackId)
-            if genre in " ".join(info["artist"]["genres"]):
-                pass
-            else:
-                del trimmed[entry]
-        out = trimmed
-
-    TrimResults(results, out, statCount, reverse="reverse" not in message.content)
+    plan = CompileFilters(message.content)
+    # metadata is only resolved for the entries the cheap checks keep
+    kept = [entry for entry in out if plan.Matches(entry)]
+    if plan.Released:
+        releases = await GetReleaseIndex(x.TrackId for x in kept)
+        for start, end in plan.Released:
+            tracks = releases.Between(start, end)
+            kept = [x for x in kept if x.TrackId in tracks]
+    if plan.Genre is not None:
+        genres = await GetGenreIndex(x.TrackId for x in kept)
+        artists = genres.ArtistsMatching(plan.Genre)
+        kept = [x for x in kept if genres.ArtistOf(x) in artists]
+    TrimResults(
+        results,
+        ((entry, out[entry]) for entry in kept),
+        plan.StatCount,
+        plan.Reverse,
+    )
     return results
 
 
-def TrimResults(results: dict, out: dict, statCount: int, reverse: bool) -> None:
-    """Sort, set unique values or trim length."""
-    sortedTuples = sorted(out.items(), key=lambda x: x[1], reverse=reverse)
+def TrimResults(
+    results: dict,
+    items: Iterable[tuple[UserDataEntry, Any]],
+    statCount: int,
+    reverse: bool,
+) -> None:
+    """Select the top statCount values, keeping the first entry per value if unique."""
     if results["Unique"]:
-        seen = set()
-        uniqueTuples = []
-        for entry, value in sortedTuples:
-            if value not in seen:
-                uniqueTuples.append((entry, value))
-                seen.add(value)
-        sortedTuples = uniqueTuples
-    if statCount < len(sortedTuples):
-        sortedTuples = sortedTuples[:statCount]
-
-    results["Filtered"] = sortedTuples
+        firstByValue: dict[Any, UserDataEntry] = {}
+        for entry, value in items:
+            firstByValue.setdefault(value, entry)
+        items = ((entry, value) for value, entry in firstByValue.items())
+    # both are stable, matching a full sort followed by a slice
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    results["Filtered"] = select(max(statCount, 0), items, key=lambda x: x[1])
 
 
 async def GetReleaseDate(data: list[UserDataEntry]) -> dict:
@@ -78,7 +197,9 @@ async def GetReleaseDate(data: list[UserDataEntry]) -> dict:
         return f"{data} -> {entry.TrackInfo} added by {entry.User}"
 
     output = {}
-    for entry in [x for x in data if x.EntryStatus.WasSuccessful]:
+    added = [x for x in data if x.EntryStatus.WasSuccessful]
+    await GetFullInfoBatch(x.TrackId for x in added)
+    for entry in added:
         info = await GetFullInfo(entry.TrackId)
         releaseDate = info["track"]["album"]["release_date"]
         output[entry] = releaseDate
@@ -94,7 +215,9 @@ async def GetReleaseDate(data: list[UserDataEntry]) -> dict:
 async def GetDuration(data: list[UserDataEntry]) -> dict:
     """Get data for how the longest/shortest song."""
     timed: dict[UserDataEntry, int] = {}
-    for song in [x for x in data if x.EntryStatus.WasSuccessful]:
+    added = [x for x in data if x.EntryStatus.WasSuccessful]
+    await GetFullInfoBatch(x.TrackId for x in added)
+    for song in added:
         info = await GetFullInfo(song.TrackId)
         timed[song] = info["track"]["duration_ms"]
 
@@ -131,7 +254,9 @@ async def GetRecent(data: list[UserDataEntry]) -> dict:
 async def GetPopularityTracks(data: list[UserDataEntry]) -> dict:
     """Get most popular tracks added."""
     output = {}
-    for entry in [x for x in data if x.EntryStatus.WasSuccessful]:
+    added = [x for x in data if x.EntryStatus.WasSuccessful]
+    await GetFullInfoBatch(x.TrackId for x in added)
+    for entry in added:
         info = await GetFullInfo(entry.TrackId)
         output[entry] = info["track"]["popularity"]
 
@@ -146,15 +271,14 @@ async def GetPopularityTracks(data: list[UserDataEntry]) -> dict:
     }
 
 
-async def GetPopularityArtists(data: list[UserDataEntry]) -> dict:
+async def GetPopularityArtists(playlistID: str | None, window: TimeWindow | None) -> dict:
     """Get most popular artists added."""
     output = {}
-    for artist in {x.Artist for x in data if x.EntryStatus.WasSuccessful}:
-        artistTrack: list[UserDataEntry] = [
-            x for x in data if x.EntryStatus.WasSuccessful and x.Artist == artist
-        ]
-        info: dict = await GetFullInfo(artistTrack[0].TrackId)
-        output[artistTrack[0]] = info["artist"]["popularity"]
+    firstTracks = (await GetAggregates(playlistID, window=window)).ArtistFirst.values()
+    await GetFullInfoBatch(x.TrackId for x in firstTracks)
+    for entry in firstTracks:
+        info: dict = await GetFullInfo(entry.TrackId)
+        output[entry] = info["artist"]["popularity"]
 
     async def Formatter(entry: UserDataEntry, data: Any) -> str:
         return f"{data} -> {entry.Artist}"
@@ -167,12 +291,10 @@ async def GetPopularityArtists(data: list[UserDataEntry]) -> dict:
     }
 
 
-async def GetContributors(data: list[UserDataEntry]) -> dict:
+async def GetContributors(playlistID: str | None, window: TimeWindow | None) -> dict:
     """Get number of tracks added."""
-    output = {}
-    for user in {x.User for x in data if x.EntryStatus.WasSuccessful}:
-        userTracks = [x for x in data if user == x.User and x.EntryStatus.WasSuccessful]
-        output[userTracks[0]] = len(userTracks)
+    aggregates = await GetAggregates(playlistID, window=window)
+    output = {entry: aggregates.Users[user] for user, entry in aggregates.UserFirst.items()}
 
     async def Formatter(entry: UserDataEntry, data: Any) -> str:
         return f"{data:03d} tracks -> {entry.User}"
@@ -188,8 +310,8 @@ async def GetContributors(data: list[UserDataEntry]) -> dict:
 # region SpecialCases
 async def GetUnlabeled() -> dict:
     """Get non genre-ed artists."""
-    mem = await GetMemory()
-    artists = [x for x in mem["Cache"]["artists"].values() if x["genres"] == []]
+    cache = await GetCache()
+    artists = [x for _, x in await cache.LoadItems("artists") if x["genres"] == []]
     return {
         "Title": "Missing Genres",
         "Data": dict.fromkeys(artists, None),
@@ -199,11 +321,10 @@ async def GetUnlabeled() -> dict:
 
 async def GetOnTheList() -> dict:
     """Return the current list."""
-    mem = await GetMemory()
-    artistInfo = mem["Cache"]["artists"]
+    cache = await GetCache()
     out = []
     for artistID, rating in CONFIG["Vibes"].items():
-        artist = artistInfo.get(artistID, None)
+        artist = cache.Get("artists", artistID)
         out.append((artist["name"] if artist else artistID, float(rating)))
     return {"Title": "On The List", "Formatter": lambda x: x[0], "Data": out}
 
@@ -217,7 +338,9 @@ async def UserStats(message: Message) -> None:
     Args:
         message (Message): triggering message
     """
-    data: list[UserDataEntry] = await GetUserData()
+    window = ParseTimeWindow(message.content)
+    store = await GetUserDataStore()
+    data: list[UserDataEntry] = store.Entries if window is None else store.Between(window)
     playlistID = CONFIG["Channel Maps"].get(message.channel.name, None)
     data = [x for x in data if x.PlaylistID == playlistID]
     result: dict = {}
@@ -228,8 +351,8 @@ async def UserStats(message: Message) -> None:
         "duration": lambda: GetDuration(data),
         "recent": lambda: GetRecent(data),
         "popularity_tracks": lambda: GetPopularityTracks(data),
-        "popularity_artists": lambda: GetPopularityArtists(data),
-        "contrib": lambda: GetContributors(data),
+        "popularity_artists": lambda: GetPopularityArtists(playlistID, window),
+        "contrib": lambda: GetContributors(playlistID, window),
     }
     if message.content.split()[1] not in handlers:
         await SendMessage(
@@ -245,7 +368,11 @@ async def UserStats(message: Message) -> None:
         if keyword in message.content.split()[1]:
             result: dict = await handler()
             break
-    result = await FilterData(message, result)
+    try:
+        result = await FilterData(message, result)
+    except FilterError as e:
+        await SendMessage(str(e), message, reply=True)
+        return
     outStr = f"{result['Title']}:\n" + "\n".join(
         [await result["Formatter"](entry, data) for entry, data in result["Filtered"]],
     )
@@ -318,6 +445,7 @@ async def UserStats(message: Message) -> None:
 
 async def GetUserInfo(
     data: list[UserDataEntry],
+    playlistID: str | None,
     message: str,
     useGenres: bool,
     useArtists: bool,
@@ -335,22 +463,16 @@ async def GetUserInfo(
     )
     print(user, userData)
     if useGenres:
-        genres = []
-        for d in userData:
-            info = await GetFullInfo(d.TrackId)
-            genres.extend(info["artist"]["genres"])
-        genreFreq = {x: genres.count(x) for x in set(genres)}
-        out = sorted(genreFreq.items(), key=lambda x: x[1])
+        aggregates = await GetAggregates(playlistID, withMetadata=True)
+        out = sorted(aggregates.UserGenres[user].items(), key=lambda x: x[1])
     elif useArtists:
-        artists = [x.Artist for x in userData]
-        artistFreq = {x: artists.count(x) for x in set(artists)}
-        out = sorted(artistFreq.items(), key=lambda x: x[1])
+        aggregates = await GetAggregates(playlistID)
+        out = sorted(aggregates.UserArtists[user].items(), key=lambda x: x[1])
     elif getGenre:
         if genre := re.search(r"genre=([^\n]+)", message):
-            genre = genre.group(1)
-            tracks = [
-                x for x in userData if genre in (await GetFullInfo(x.TrackId))["artist"]["genres"]
-            ]
+            index = await GetGenreIndex(x.TrackId for x in userData)
+            artists = index.ByGenre.get(genre.group(1), set())
+            tracks = [x for x in userData if index.ArtistOf(x) in artists]
             out = [(x.TimeAdded.strftime("%Y-%m-%d %H:%M"), x.TrackInfo) for x in tracks]
     else:
         out = [(x.TimeAdded.strftime("%Y-%m-%d %H:%M"), x.TrackInfo) for x in userData]
@@ -359,53 +481,41 @@ async def GetUserInfo(
 
 
 async def GetGenreCount(
-    data: list[UserDataEntry],
+    playlistID: str | None,
 ) -> tuple[str, list]:
     """Get data for how many genre was added.
 
     Parameters
     ----------
-    data : list[UserDataEntry]
-        entry data
-    useReverse: bool
-        flip data
+    playlistID : str | None
+        unique playlist id
 
     Returns
     -------
     str
         result str
     """
-    genres: list[str] = [
-        genre
-        for track in [x for x in data if x.EntryStatus.WasSuccessful]
-        for genre in (await GetFullInfo(track.TrackId))["artist"]["genres"]
-    ]
-    genreFreq = {x: genres.count(x) for x in set(genres)}
-    return "Genre Frequency:", sorted(genreFreq.items(), key=lambda x: x[1])
+    aggregates = await GetAggregates(playlistID, withMetadata=True)
+    return "Genre Frequency:", sorted(aggregates.Genres.items(), key=lambda x: x[1])
 
 
 async def GetArtistCount(
-    data: list[UserDataEntry],
+    playlistID: str | None,
 ) -> tuple[str, list]:
     """Get data for how many times an artist was added.
 
     Parameters
     ----------
-    data : list[UserDataEntry]
-        entry data
-    useReverse: bool
-        flip data
+    playlistID : str | None
+        unique playlist id
 
     Returns
     -------
     str
         result str
     """
-    addedSongs: list[UserDataEntry] = [x for x in data if x.EntryStatus.WasSuccessful]
-    addFreq = {
-        artist: len([entry for entry in addedSongs if entry.Artist == artist])
-        for artist in {x.Artist for x in data}
-    }
+    aggregates = await GetAggregates(playlistID)
+    addFreq = {artist: aggregates.Artists[artist] for artist in aggregates.ArtistNames}
     addFreq = sorted(addFreq.items(), key=lambda x: x[1])
     addFreq = [x for x in addFreq if x[0] != 0]
     return "Artist Frequency", addFreq
@@ -439,6 +549,8 @@ async def GetMainstreamRating(
     if isinstance(df, pd.Series):
         return "Mainstream Ratings:", []
     users = await PrepUserData(df)
+    if useQuantiles:
+        await GetFullInfoBatch(x.TrackId for x in data if x.EntryStatus.WasSuccessful)
     for uname in {x.User for x in data}:
         if useQuantiles:
             popularity = []
@@ -483,7 +595,9 @@ async def GetPersonalMainstream(
         result str
     """
     results = {}
-    for entry in [x for x in data if x.EntryStatus.WasSuccessful and x.User == user]:
+    userData = [x for x in data if x.EntryStatus.WasSuccessful and x.User == user]
+    await GetFullInfoBatch(x.TrackId for x in userData)
+    for entry in userData:
         info = await GetFullInfo(entry.TrackId)
         if useTracks:
             results[entry.TrackInfo] = (0.75 * info["track"]["popularity"]) + (
@@ -499,28 +613,20 @@ async def GetPersonalMainstream(
     return f"Mainstream Data for {user}:", sorted(results.items(), key=lambda x: x[1])
 
 
-async def GetPosterCount(data: list[UserDataEntry]) -> tuple[str, list]:
+async def GetPosterCount(playlistID: str | None) -> tuple[str, list]:
     """Get data for how many songs a user added.
 
     Parameters
     ----------
-    data : list[UserDataEntry]
-        entry data
+    playlistID : str | None
+        unique playlist id
 
     Returns
     -------
     str
         result str
     """
-    addFreq = {
-        uname: len(
-            [
-                entry
-                for entry in [y for y in data if y.EntryStatus.WasSuccessful]
-                if entry.User == uname
-            ],
-        )
-        for uname in {x.User for x in data}
-    }
+    aggregates = await GetAggregates(playlistID)
+    addFreq = {uname: aggregates.Users[uname] for uname in aggregates.Posters}
     addFreq = sorted(addFreq.items(), key=lambda x: x[1])
     return "Song Posters:", addFreq
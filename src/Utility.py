@@ -1,9 +1,12 @@
+import datetime
 import re
 
 from discord import Message
 from more_itertools import chunked
 
-from Defines import CONFIG, GetMemory, GetUserData, SaveMemory
+from Defines import CONFIG, GetMemory, GetUserDataStore, SaveMemory, TimeWindow
+
+TIME_UNITS: dict[str, str] = {"h": "hours", "d": "days", "w": "weeks"}
 
 
 async def SendMessage(
@@ -35,7 +38,7 @@ async def DadMode(message: Message) -> None:
 
 
 async def NotifyPlaylistLength(response: Message) -> None:
-    playlistLen = len([x for x in await GetUserData() if x.EntryStatus.WasSuccessful])
+    playlistLen = (await GetUserDataStore()).SuccessCount
     if playlistLen % CONFIG["UpdateInterval"] == 0:
         await SendMessage(f"This was song #{playlistLen} 🙌", response, reply=True)
 
@@ -43,13 +46,7 @@ async def NotifyPlaylistLength(response: Message) -> None:
 
 
 async def NotifyUserLength(response: Message) -> None:
-    userLen = len(
-        [
-            x
-            for x in await GetUserData()
-            if x.EntryStatus.WasSuccessful and x.User == str(response.author)
-        ],
-    )
+    userLen = (await GetUserDataStore()).UserSuccessCount[str(response.author)]
     if userLen % CONFIG["UpdateInterval"] == 0:
         await SendMessage(f"This was {response.author}'s #{userLen} 🙌", response, reply=True)
 
@@ -58,3 +55,58 @@ async def NotifyUserLength(response: Message) -> None:
 
 async def TimeToSec(time) -> int:
     return (time.hour * 60 + time.minute) * 60 + time.second
+
+
+def ParseTimeWindow(content: str) -> TimeWindow | None:
+    """Get the since:, until: and last: filters of a command as a time window.
+
+    since: and until: take iso dates or datetimes, a bare until: date includes that day.
+    last: takes a count of hours, days or weeks such as last:30d and overrides since:.
+    Times with a utc offset are converted to naive local time, as the log is kept in.
+    Returns None if the command has no time filter.
+    """
+    since: datetime.datetime | None = None
+    until: datetime.datetime | None = None
+    if sinceMatch := re.search(r"\ssince:(\S+)", content):
+        try:
+            since = datetime.datetime.fromisoformat(sinceMatch.group(1))
+        except ValueError:
+            pass
+    if untilMatch := re.search(r"\suntil:(\S+)", content):
+        try:
+            until = datetime.datetime.fromisoformat(untilMatch.group(1))
+            if re.fullmatch(r"\d{4}-\d{2}-\d{2}", untilMatch.group(1)):
+                until += datetime.timedelta(days=1)
+        except ValueError:
+            pass
+    if lastMatch := re.search(r"\slast:(\d+)([hdw])\b", content):
+        amount, unit = lastMatch.groups()
+        since = datetime.datetime.now() - datetime.timedelta(**{TIME_UNITS[unit]: int(amount)})
+    if since is None and until is None:
+        return None
+    return NaiveLocal(since), NaiveLocal(until)
+
+
+def NaiveLocal(time: datetime.datetime | None) -> datetime.datetime | None:
+    """Convert a time with a utc offset to naive local time, naive times are left as is."""
+    if time is None or time.tzinfo is None:
+        return time
+    return time.astimezone().replace(tzinfo=None)
+
+
+def CodeBlocks(text: str, limit: int = 2000) -> list[str]:
+    """Split text on line boundaries into fenced code blocks that each fit in a message.
+
+    Lines too long for a block on their own are cut short.
+    """
+    room = limit - len("```\n\n```")
+    blocks: list[list[str]] = [[]]
+    size = 0
+    for line in text.splitlines():
+        line = line[:room]
+        if blocks[-1] and size + len(line) + 1 > room:
+            blocks.append([])
+            size = 0
+        blocks[-1].append(line)
+        size += len(line) + 1
+    return ["```\n" + "\n".join(x) + "\n```" for x in blocks]
@@ -0,0 +1,50 @@
+"""Process pools whose workers import only what their tasks need.
+
+Spawned workers normally re-run the parent's main module first, which for the bot
+imports Defines, reads the config and builds the discord and spotify clients. Workers
+started here are handed an empty main module instead, so they only import the modules
+holding their initializer and tasks. Those modules must not import the bot.
+"""
+
+import multiprocessing
+import sys
+import threading
+import types
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any
+
+# sys.modules is process wide, only one pool at a time may swap its main module
+MAIN_LOCK: threading.Lock = threading.Lock()
+
+
+class WorkerPool(ProcessPoolExecutor):
+    """Spawn based process pool whose workers skip importing the bot."""
+
+    def __init__(self, maxWorkers: int, initializer: Callable[[], Any] | None = None) -> None:
+        """Create a pool, workers start on demand as tasks are submitted.
+
+        Parameters
+        ----------
+        maxWorkers : int
+            number of worker processes
+        initializer : Callable[[], Any] | None, optional
+            run once in every worker as it starts, by default None
+        """
+        super().__init__(
+            max_workers=maxWorkers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+        )
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        """Schedule a task, starting a worker for it if none is idle."""
+        # spawn reads the main module to re-run from sys.modules as each worker starts,
+        # which happens inside submit
+        with MAIN_LOCK:
+            main = sys.modules["__main__"]
+            sys.modules["__main__"] = types.ModuleType("__main__")
+            try:
+                return super().submit(fn, *args, **kwargs)
+            finally:
+                sys.modules["__main__"] = main